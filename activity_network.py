@@ -13,29 +13,42 @@ import os
 import re
 import json
 import sys
+import asyncio
+import functools
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from collections import defaultdict
 
-from dotenv import load_dotenv
+try:
+    import orjson
+except ImportError:  # optional accelerator; fall back to the stdlib json module
+    orjson = None
+
 from config import (
     LLM_MODEL_NAME,
     LLM_TEMPERATURE_CONCEPT_EXTRACTION,
     LLM_TEMPERATURE_DAY_ACTIVITY,
     LLM_MAX_TOKENS_CONCEPT,
+    LLM_MAX_TOKENS_CONCEPT_BATCH,
+    LLM_MAX_PROMPT_TOKENS_CONCEPT_BATCH,
     LLM_MAX_TOKENS_AGGREGATE,
-    LLM_MAX_TOKENS_DAY
+    LLM_MAX_TOKENS_HIERARCHY,
+    LLM_MAX_TOKENS_DAY,
+    LLM_MAX_SAMPLES_PER_ACTIVITY,
+    LLM_MAX_CHARS_PER_SAMPLE,
+    ENABLE_SEMANTIC_DEDUP,
+    SEMANTIC_DEDUP_MODEL,
+    SEMANTIC_DEDUP_THRESHOLD
 )
 from llm_utils import (
-    get_groq_client,
     parse_json_response,
     parse_list_response_fallback,
-    call_llm,
-    parse_mapping_response
+    call_llm_async,
+    close_async_groq_client
 )
 
-# Load environment variables
-load_dotenv()
+# Refined-text timestamp line (e.g., "8 Jan 2026 at 12:30 AM"): day month year at time AM/PM
+_TIMESTAMP_RE = re.compile(r'\d{1,2}\s+\w+\s+\d{4}\s+at\s+\d{1,2}:\d{2}\s+(?:AM|PM)')
 
 
 @dataclass
@@ -49,7 +62,113 @@ class ActivityNode:
     parent: Optional[str] = None  # ID of parent node
 
 
-def parse_refined_text(file_path: str) -> List[Dict[str, str]]:
+def _to_json(obj, indent: bool = True) -> str:
+    """Serialize obj to JSON text (2-space indent by default), via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False)
+
+
+@functools.lru_cache(maxsize=4096)
+def _slug(label: str) -> str:
+    """Turn a node label into the ID-safe form used in node IDs."""
+    return label.replace(' ', '_').replace('/', '_')
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to at most `limit` characters, marking the cut with '...'."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+@functools.lru_cache(maxsize=1)
+def _get_embedding_model():
+    """Load the sentence embedding model used for semantic dedup (once)."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SEMANTIC_DEDUP_MODEL)
+
+
+def _dedupe_semantic(activities: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Drop entries whose content embedding has cosine similarity above
+    SEMANTIC_DEDUP_THRESHOLD with an earlier kept entry.
+    """
+    try:
+        model = _get_embedding_model()
+    except ImportError:
+        print("Warning: sentence-transformers not installed, skipping semantic dedup")
+        return activities
+
+    embeddings = model.encode([a['content'] for a in activities], normalize_embeddings=True)
+    kept: List[int] = []
+    for i, embedding in enumerate(embeddings):
+        if all(float(embedding @ embeddings[j]) <= SEMANTIC_DEDUP_THRESHOLD for j in kept):
+            kept.append(i)
+    return [activities[i] for i in kept]
+
+
+def _dedupe_entries(activities: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Drop entries whose content repeats an earlier entry of the same activity,
+    plus near-duplicates when config.ENABLE_SEMANTIC_DEDUP is set.
+    """
+    seen = set()
+    unique = []
+    for act in activities:
+        if act['content'] not in seen:
+            seen.add(act['content'])
+            unique.append(act)
+
+    if ENABLE_SEMANTIC_DEDUP and len(unique) > 1:
+        unique = _dedupe_semantic(unique)
+    return unique
+
+
+def _sample_activity_entries(activities: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Pick the entries of an activity group to show the LLM: duplicates are
+    dropped, then at most LLM_MAX_SAMPLES_PER_ACTIVITY entries are spread
+    evenly across the group, each with content cut to
+    LLM_MAX_CHARS_PER_SAMPLE characters.
+
+    Sampling is deterministic so unchanged input produces identical prompts
+    (and LLM cache hits).
+    """
+    activities = _dedupe_entries(activities)
+    if len(activities) > LLM_MAX_SAMPLES_PER_ACTIVITY:
+        step = len(activities) / LLM_MAX_SAMPLES_PER_ACTIVITY
+        activities = [activities[int(i * step)] for i in range(LLM_MAX_SAMPLES_PER_ACTIVITY)]
+    return [
+        {**act, 'content': _truncate(act['content'], LLM_MAX_CHARS_PER_SAMPLE)}
+        for act in activities
+    ]
+
+
+def _iter_sections(lines: Iterable[str]) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yield (timestamp, lines) pairs from refined-text lines. Each timestamp
+    line starts a section holding the stripped, non-empty lines up to the
+    next one; lines before the first timestamp are skipped.
+    """
+    timestamp = None
+    section: List[str] = []
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # Cheap shape test first, so the regex only runs on likely timestamps
+        if line[0].isdigit() and line.endswith(('AM', 'PM')) and _TIMESTAMP_RE.fullmatch(line):
+            if timestamp is not None:
+                yield timestamp, section
+            timestamp, section = line, []
+        elif timestamp is not None:
+            section.append(line)
+
+    if timestamp is not None:
+        yield timestamp, section
+
+
+def parse_refined_text(file_path: str) -> Iterator[Dict[str, str]]:
     """
     Parse refined text file to extract activities with timestamps and content.
     
@@ -58,68 +177,43 @@ def parse_refined_text(file_path: str) -> List[Dict[str, str]]:
     [app/activity name]
     [content text]
     
-    Returns:
-        List of dictionaries with 'timestamp', 'activity', and 'content' keys
-    """
-    activities = []
+    The file is read line by line, so only the current section is held in
+    memory.
     
+    Yields:
+        Dictionaries with 'timestamp', 'activity', and 'content' keys
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        f = open(file_path, 'r', encoding='utf-8', errors='replace')
     except FileNotFoundError:
         print(f"Error: File not found: {file_path}")
-        return activities
+        return
     except Exception as e:
         print(f"Error reading file: {e}")
-        return activities
-    
-    # Split by timestamp pattern (e.g., "8 Jan 2026 at 12:30 AM")
-    # Pattern: day month year at time AM/PM
-    timestamp_pattern = r'(\d{1,2}\s+\w+\s+\d{4}\s+at\s+\d{1,2}:\d{2}\s+(?:AM|PM))'
-    
-    sections = re.split(timestamp_pattern, content)
-    
-    # Process sections (skip first empty if split starts with pattern)
-    i = 1 if sections[0].strip() == '' else 0
+        return
     
-    while i < len(sections) - 1:
-        timestamp = sections[i].strip()
-        text_block = sections[i + 1].strip() if i + 1 < len(sections) else ""
-        
-        if not timestamp or not text_block:
-            i += 2
-            continue
-        
-        # Split text block into lines
-        lines = [line.strip() for line in text_block.split('\n') if line.strip()]
-        
-        if not lines:
-            i += 2
-            continue
-        
-        # First non-empty line is typically the activity/app name
-        activity_name = lines[0]
-        # Rest is the content
-        activity_content = '\n'.join(lines[1:]) if len(lines) > 1 else ""
-        
-        # If no content but activity name exists, use activity name as content
-        if not activity_content and activity_name:
-            activity_content = activity_name
-        
-        # Only add if we have a valid activity name
-        if activity_name:
-            activities.append({
+    with f:
+        for timestamp, lines in _iter_sections(f):
+            if not lines:
+                continue
+            
+            # First non-empty line is typically the activity/app name
+            activity_name = lines[0]
+            # Rest is the content
+            activity_content = '\n'.join(lines[1:]) if len(lines) > 1 else ""
+            
+            # If no content but activity name exists, use activity name as content
+            if not activity_content and activity_name:
+                activity_content = activity_name
+            
+            yield {
                 'timestamp': timestamp,
                 'activity': activity_name,
                 'content': activity_content
-            })
-        
-        i += 2
-    
-    return activities
+            }
 
 
-def identify_layer1_activities(activities: List[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
+def identify_layer1_activities(activities: Iterable[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
     """
     Identify unique Layer 1 activities from parsed activities.
     Groups activities by their app/activity name.
@@ -137,7 +231,7 @@ def identify_layer1_activities(activities: List[Dict[str, str]]) -> Dict[str, Li
     return dict(activity_groups)
 
 
-def extract_activity_concepts_llm(activity_name: str, activities: List[Dict[str, str]]) -> List[str]:
+async def extract_activity_concepts_llm(activity_name: str, activities: List[Dict[str, str]]) -> List[str]:
     """
     Use LLM to extract high-level concepts from an activity group.
     
@@ -148,11 +242,13 @@ def extract_activity_concepts_llm(activity_name: str, activities: List[Dict[str,
     Returns:
         List of concept strings (2-4 concepts)
     """
-    # Combine all content for this activity
-    combined_content = f"Activity: {activity_name}\n\n"
-    for act in activities:
-        combined_content += f"Timestamp: {act['timestamp']}\n"
-        combined_content += f"Content: {act['content']}\n\n"
+    # Combine sampled content for this activity (single join instead of repeated +=)
+    parts = [f"Activity: {activity_name}\n\n"]
+    parts.extend(
+        f"Timestamp: {act['timestamp']}\nContent: {act['content']}\n\n"
+        for act in _sample_activity_entries(activities)
+    )
+    combined_content = "".join(parts)
     
     prompt = f"""Analyze the following activity entries and extract 2-4 high-level concepts or themes that represent this activity.
 
@@ -166,10 +262,11 @@ Return ONLY a JSON array of concept strings, nothing else. Example format:
 If you cannot identify meaningful concepts, return an empty array []."""
 
     try:
-        response = call_llm(
+        response = await call_llm_async(
             prompt,
             temperature=LLM_TEMPERATURE_CONCEPT_EXTRACTION,
-            max_tokens=LLM_MAX_TOKENS_CONCEPT
+            max_tokens=LLM_MAX_TOKENS_CONCEPT,
+            stop_at_json_end=True
         )
 
         # Parse JSON response with fallback
@@ -189,58 +286,287 @@ If you cannot identify meaningful concepts, return an empty array []."""
         return [activity_name.lower()]
 
 
-def aggregate_activities_llm(activities: List[str]) -> List[str]:
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for prompt budgeting."""
+    return len(text) // 4 + 1
+
+
+async def _extract_concepts_batch_llm(entries: List[Dict]) -> Dict[str, List[str]]:
     """
-    Aggregate multiple activities into fewer, broader concepts using LLM.
-    
+    Extract concepts for several activities with a single LLM call.
+
     Args:
-        activities: List of activity/concept strings to aggregate
-        
+        entries: List of {"activity": name, "samples": [content, ...]} dicts
+
     Returns:
-        List of broader concept strings (roughly half the input count, minimum 1)
+        Dictionary mapping activity names to concept lists. Activities the
+        response did not cover are left out so the caller can retry them.
+    """
+    prompt = f"""Analyze the following activities from someone's computer usage. For EACH activity, extract 2-4 high-level concepts or themes that represent it.
+
+Activities (JSON list of activity names with sample content):
+{_to_json(entries)}
+
+Each concept should be a short phrase (2-5 words) that captures the key purpose, theme, or pattern of the activity.
+
+Return ONLY a JSON object mapping every activity name, exactly as given, to an array of its concept strings, nothing else. Example format:
+{{"Activity One": ["concept one", "concept two"], "Activity Two": ["concept three", "concept four"]}}
+
+If you cannot identify meaningful concepts for an activity, map it to an empty array []."""
+
+    try:
+        response = await call_llm_async(
+            prompt,
+            temperature=LLM_TEMPERATURE_CONCEPT_EXTRACTION,
+            max_tokens=min(LLM_MAX_TOKENS_CONCEPT * len(entries), LLM_MAX_TOKENS_CONCEPT_BATCH),
+            stop_at_json_end=True
+        )
+        parsed = parse_json_response(response, fallback_parser=lambda r: {})
+    except Exception as e:
+        print(f"Warning: Batched concept extraction failed ({e})")
+        return {}
+
+    if not isinstance(parsed, dict):
+        return {}
+
+    concepts_by_activity = {}
+    for entry in entries:
+        concepts = parsed.get(entry['activity'])
+        if isinstance(concepts, list):
+            concepts_by_activity[entry['activity']] = [str(c).lower().strip() for c in concepts[:4] if c]
+    return concepts_by_activity
+
+
+async def extract_all_layer1_concepts_llm(
+    activity_groups: Dict[str, List[Dict[str, str]]]
+) -> Dict[str, List[str]]:
+    """
+    Extract concepts for every Layer 1 activity using as few LLM calls as possible.
+
+    Activities are packed into batched prompts of up to
+    LLM_MAX_PROMPT_TOKENS_CONCEPT_BATCH estimated tokens each (typically a
+    single call per day). Activities too large to batch, or missing from a batched
+    response, fall back to extract_activity_concepts_llm.
+
+    Args:
+        activity_groups: Activity name -> entries, from identify_layer1_activities()
+
+    Returns:
+        Dictionary mapping activity names to concept lists, in input order
+    """
+    chunks: List[List[Dict]] = [[]]
+    chunk_tokens = 0
+
+    for activity_name, activity_list in activity_groups.items():
+        entry = {
+            'activity': activity_name,
+            'samples': [a['content'] for a in _sample_activity_entries(activity_list)]
+        }
+        tokens = _estimate_tokens(_to_json(entry, indent=False))
+        if tokens > LLM_MAX_PROMPT_TOKENS_CONCEPT_BATCH:
+            continue  # Handled by the per-activity fallback below
+        if chunks[-1] and chunk_tokens + tokens > LLM_MAX_PROMPT_TOKENS_CONCEPT_BATCH:
+            chunks.append([])
+            chunk_tokens = 0
+        chunks[-1].append(entry)
+        chunk_tokens += tokens
+
+    concepts_by_activity: Dict[str, List[str]] = {}
+    for result in await asyncio.gather(*[_extract_concepts_batch_llm(c) for c in chunks if c]):
+        concepts_by_activity.update(result)
+
+    missing = [name for name in activity_groups if name not in concepts_by_activity]
+    if missing:
+        print(f"  Extracting concepts individually for: {missing}")
+        fallback = await asyncio.gather(*[
+            extract_activity_concepts_llm(name, activity_groups[name]) for name in missing
+        ])
+        concepts_by_activity.update(zip(missing, fallback))
+
+    return {name: concepts_by_activity[name] for name in activity_groups}
+
+
+async def aggregate_and_map_llm(
+    concepts: List[str],
+    target_count: int
+) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Aggregate concepts into fewer, broader concepts and map each input concept
+    to its broader concept, in a single LLM call.
+
+    Args:
+        concepts: List of activity/concept strings to aggregate
+        target_count: Number of broader concepts to ask for
+
+    Returns:
+        Tuple of (broader concepts, mapping of input concept -> broader concept).
+        Falls back to the first target_count concepts with round-robin
+        assignment if the response is unusable.
     """
-    if len(activities) <= 1:
-        return activities
-    
-    # Target roughly half the activities, minimum 1
-    target_count = max(1, len(activities) // 2)
-    
     prompt = f"""You are given a list of activities/concepts from someone's daily computer usage.
-Your task is to group and merge these into {target_count} broader, higher-level activity concepts.
+Your task is to group and merge these into {target_count} broader, higher-level activity concepts, and assign every input concept to one of them.
 
-Activities to aggregate:
-{json.dumps(activities, indent=2)}
+Concepts to aggregate:
+{_to_json(concepts)}
 
 Merge related activities together into broader themes. Each new concept should be a short phrase (2-6 words) that represents a category or theme.
 
-Return ONLY a JSON array of the {target_count} broader concept strings, nothing else. Example format:
-["broader concept one", "broader concept two"]"""
+Return ONLY a JSON object with two fields, nothing else:
+- "broader": an array of the {target_count} broader concept strings
+- "mapping": an object mapping each input concept, exactly as given, to one of the broader concepts
+
+Example format:
+{{"broader": ["broader concept one", "broader concept two"], "mapping": {{"concept1": "broader concept one", "concept2": "broader concept two"}}}}"""
 
     try:
-        response = call_llm(
+        response = await call_llm_async(
             prompt,
             temperature=LLM_TEMPERATURE_CONCEPT_EXTRACTION,
-            max_tokens=LLM_MAX_TOKENS_AGGREGATE
+            max_tokens=LLM_MAX_TOKENS_AGGREGATE,
+            stop_at_json_end=True
         )
 
-        # Parse JSON response with fallback
-        broader = parse_json_response(
-            response,
-            fallback_parser=parse_list_response_fallback
-        )
+        parsed = parse_json_response(response, fallback_parser=lambda r: {})
+        broader = [str(c).lower().strip() for c in parsed.get('broader', []) if c]
+        mapping = {
+            str(concept).lower().strip(): str(target).lower().strip()
+            for concept, target in parsed.get('mapping', {}).items()
+        }
 
-        if isinstance(broader, list):
-            return [str(c).lower().strip() for c in broader if c]
+        if broader and set(mapping.values()) <= set(broader):
+            return broader, mapping
+        print("Warning: Aggregation response failed validation, using fallback")
 
-        return parse_list_response_fallback(response)[:target_count]
-        
     except Exception as e:
         print(f"Error aggregating activities: {e}")
-        # Fallback: return first half
-        return activities[:target_count] if target_count > 0 else activities
 
+    # Fallback: keep the first target_count concepts, assign round-robin
+    broader = concepts[:target_count]
+    return broader, {c: broader[i % len(broader)] for i, c in enumerate(concepts)}
+
+
+def _check_hierarchy(subtree, known: Dict[str, str], placed: set) -> bool:
+    """
+    Validate a hierarchy subtree: objects map labels to subtrees and every
+    branch ends in a non-empty list of known leaf concepts. Leaves seen are
+    recorded (lowercased) in placed.
+    """
+    if isinstance(subtree, list):
+        for leaf in subtree:
+            if not isinstance(leaf, str) or leaf.lower().strip() not in known:
+                return False
+            placed.add(leaf.lower().strip())
+        return bool(subtree)
+    if isinstance(subtree, dict):
+        return bool(subtree) and all(
+            isinstance(label, str) and label.strip() and _check_hierarchy(child, known, placed)
+            for label, child in subtree.items()
+        )
+    return False
+
+
+async def build_hierarchy_llm(concepts: List[str]) -> Optional[Tuple[str, Dict]]:
+    """
+    Ask for the whole aggregation hierarchy above the given concepts in a
+    single LLM call, instead of one aggregate-and-map round-trip per layer.
+
+    Args:
+        concepts: Layer 2 concepts (the leaves of the hierarchy)
+
+    Returns:
+        Tuple of (root label, root subtree), where a subtree is either a dict
+        of label -> subtree or a list of leaf concepts. None if the response
+        is not a single-rooted tree covering exactly the given concepts.
+    """
+    prompt = f"""You are given a list of activity concepts from someone's daily computer usage.
+Organize them into a hierarchy: group related concepts under broader themes, group those themes under even broader ones, and so on until everything falls under ONE root that captures the whole day.
+
+Leaf concepts:
+{_to_json(concepts)}
+
+Rules:
+- Use 2-4 children per group at each level, aiming for 3-5 levels in total
+- Every leaf concept must appear exactly once, spelled exactly as given
+- Each group label should be a short phrase (2-6 words); the root label 3-8 words
+
+Return ONLY a JSON tree, nothing else: an object with the root label as its single key. Groups are objects mapping labels to their children; the lowest groups are arrays of leaf concepts.
+
+Example format:
+{{"root label": {{"broader theme one": {{"theme a": ["concept1", "concept2"], "theme b": ["concept3"]}}, "broader theme two": ["concept4", "concept5"]}}}}"""
+
+    try:
+        response = await call_llm_async(
+            prompt,
+            temperature=LLM_TEMPERATURE_CONCEPT_EXTRACTION,
+            max_tokens=LLM_MAX_TOKENS_HIERARCHY,
+            stop_at_json_end=True
+        )
+
+        parsed = parse_json_response(response, fallback_parser=lambda r: None)
+        if isinstance(parsed, dict) and len(parsed) == 1:
+            (root, subtree), = parsed.items()
+            known = {c.lower().strip(): c for c in concepts}
+            placed: set = set()
+            if (isinstance(root, str) and root.strip()
+                    and _check_hierarchy(subtree, known, placed) and placed == set(known)):
+                return root.lower().strip(), subtree
+        print("Warning: Hierarchy response failed validation, using per-layer aggregation")
+
+    except Exception as e:
+        print(f"Error building hierarchy: {e}")
+
+    return None
+
+
+def _add_hierarchy_nodes(
+    nodes: Dict[str, ActivityNode],
+    subtree,
+    leaf_ids: Dict[str, str]
+) -> Tuple[List[str], int]:
+    """
+    Create nodes for the groups in a validated hierarchy subtree (depth-first).
+
+    Leaves resolve to existing Layer 2 node ids via leaf_ids; each leaf is
+    attached only under the first group that lists it, and is removed from
+    leaf_ids once placed. A group's layer is one above its highest child.
+
+    Returns:
+        Tuple of (ids of the subtree's top-level nodes, layer for their parent)
+    """
+    if isinstance(subtree, list):
+        child_ids = [leaf_ids.pop(leaf.lower().strip()) for leaf in subtree if leaf.lower().strip() in leaf_ids]
+        return child_ids, 3
+
+    child_ids = []
+    parent_layer = 3
+    for label, child in subtree.items():
+        grandchild_ids, layer = _add_hierarchy_nodes(nodes, child, leaf_ids)
+        if not grandchild_ids:
+            continue
+
+        label = label.lower().strip()
+        concept_id = f"L{layer}_{_slug(label)}"
+        if concept_id in nodes:
+            nodes[concept_id].children.extend(grandchild_ids)
+        else:
+            nodes[concept_id] = ActivityNode(
+                id=concept_id,
+                label=label,
+                layer=layer,
+                content="",
+                children=grandchild_ids,
+                parent=None
+            )
+            child_ids.append(concept_id)
+
+        for grandchild_id in grandchild_ids:
+            nodes[grandchild_id].parent = concept_id
+        parent_layer = max(parent_layer, layer + 1)
+
+    return child_ids, parent_layer
 
-def generate_day_activity_llm(concepts: List[str]) -> str:
+
+async def generate_day_activity_llm(concepts: List[str]) -> str:
     """
     Generate a single day activity concept from the final layer of concepts.
     
@@ -257,13 +583,13 @@ def generate_day_activity_llm(concepts: List[str]) -> str:
 Synthesize these into ONE single concept that captures the essence of their day's activities.
 
 Final concepts:
-{json.dumps(concepts, indent=2)}
+{_to_json(concepts)}
 
 Return ONLY a single phrase (3-8 words) that represents the day's overarching activity theme or essence.
 Do not include quotes or any other text."""
 
     try:
-        response = call_llm(
+        response = await call_llm_async(
             prompt,
             temperature=LLM_TEMPERATURE_DAY_ACTIVITY,
             max_tokens=LLM_MAX_TOKENS_DAY
@@ -277,7 +603,7 @@ Do not include quotes or any other text."""
         return " / ".join(concepts)
 
 
-def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
+async def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
     """
     Build hierarchical activity graph from refined text file.
     
@@ -287,22 +613,31 @@ def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
     Returns:
         Dictionary mapping node IDs to ActivityNode objects
     """
+    # Callers run this under asyncio.run(); close the loop's Groq client
+    # before the loop goes away so its connection pool is not leaked
+    try:
+        return await _build_activity_tree(file_path)
+    finally:
+        await close_async_groq_client()
+
+
+async def _build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
+    """Run the graph-building steps for build_activity_tree."""
     print("=" * 60)
     print("Building Activity Network Tree")
     print("=" * 60)
     
-    # Step 1: Parse refined text
+    # Step 1: Parse refined text, streaming entries straight into their groups
     print("\n[Step 1] Parsing refined text file...")
-    activities = parse_refined_text(file_path)
-    print(f"Found {len(activities)} activity entries")
+    activity_groups = identify_layer1_activities(parse_refined_text(file_path))
+    print(f"Found {sum(len(group) for group in activity_groups.values())} activity entries")
     
-    if not activities:
+    if not activity_groups:
         print("No activities found. Exiting.")
         return {}
     
     # Step 2: Identify Layer 1 activities (unique app/activity names)
     print("\n[Step 2] Identifying Layer 1 activities...")
-    activity_groups = identify_layer1_activities(activities)
     layer1_activities = list(activity_groups.keys())
     print(f"Found {len(layer1_activities)} unique activities: {layer1_activities}")
     
@@ -313,15 +648,20 @@ def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
     print("\n[Step 3] Extracting concepts for Layer 1 activities...")
     layer1_concepts = {}  # activity_name -> list of concepts
     concept_to_activity = {}  # concept -> activity_name
+    # Children of each concept node as an insertion-ordered set (dict keys)
+    # for O(1) membership checks; copied into the nodes once Step 3 is done
+    concept_children: Dict[str, Dict[str, None]] = defaultdict(dict)
     
+    # One batched call covers all activities instead of one call per activity
+    concepts_by_activity = await extract_all_layer1_concepts_llm(activity_groups)
+
     for activity_name, activity_list in activity_groups.items():
-        print(f"  Processing: {activity_name}")
-        concepts = extract_activity_concepts_llm(activity_name, activity_list)
-        print(f"    → Concepts: {concepts}")
+        concepts = concepts_by_activity[activity_name]
+        print(f"  {activity_name} → Concepts: {concepts}")
         
         # Create Layer 1 activity nodes
-        activity_id = f"L1_{activity_name.replace(' ', '_').replace('/', '_')}"
-        combined_content = "\n\n".join([f"{a['timestamp']}\n{a['content']}" for a in activity_list])
+        activity_id = f"L1_{_slug(activity_name)}"
+        combined_content = "\n\n".join(f"{a['timestamp']}\n{a['content']}" for a in activity_list)
         
         nodes[activity_id] = ActivityNode(
             id=activity_id,
@@ -335,21 +675,20 @@ def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
         # Note: An activity can have multiple concepts, so we set parent to the first one
         # but all relationships are captured via children arrays in concept nodes
         for idx, concept in enumerate(concepts):
-            concept_id = f"L2_{concept.replace(' ', '_').replace('/', '_')}"
+            concept_id = f"L2_{_slug(concept)}"
             if concept_id not in nodes:
                 nodes[concept_id] = ActivityNode(
                     id=concept_id,
                     label=concept,
                     layer=2,
                     content="",
-                    children=[activity_id],
+                    children=[],
                     parent=None
                 )
                 concept_to_activity[concept] = activity_name
-            else:
-                # Concept already exists (shared by multiple activities), add this activity as child
-                if activity_id not in nodes[concept_id].children:
-                    nodes[concept_id].children.append(activity_id)
+            
+            # Concepts shared by multiple activities collect every one as a child
+            concept_children[concept_id][activity_id] = None
             
             # Set parent for activity node (only set once, to first concept)
             # All relationships are properly captured via children arrays above
@@ -358,19 +697,35 @@ def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
         
         layer1_concepts[activity_name] = concepts
     
+    for concept_id, children in concept_children.items():
+        nodes[concept_id].children = list(children)
+    
     # Step 4: Recursive aggregation
     print("\n[Step 4] Aggregating concepts into higher layers...")
     current_layer = 2
-    current_concepts = list(set([c for concepts in layer1_concepts.values() for c in concepts]))
-    current_concept_ids = [f"L2_{c.replace(' ', '_').replace('/', '_')}" for c in current_concepts]
-    
-    while len(current_concepts) > 1:
+    # dict.fromkeys dedups while keeping first-seen order, so runs are reproducible
+    current_concepts = list(dict.fromkeys(c for concepts in layer1_concepts.values() for c in concepts))
+    current_concept_ids = [f"L2_{_slug(c)}" for c in current_concepts]
+    day_activity = None
+    
+    # Try to get every layer above Layer 2 from one call; fall back to
+    # aggregating layer by layer if the tree comes back unusable
+    hierarchy = await build_hierarchy_llm(current_concepts) if len(current_concepts) > 1 else None
+    if hierarchy is not None:
+        day_activity, root_subtree = hierarchy
+        leaf_ids = {c.lower().strip(): concept_id for c, concept_id in zip(current_concepts, current_concept_ids)}
+        current_concept_ids, day_layer = _add_hierarchy_nodes(nodes, root_subtree, leaf_ids)
+        current_layer = day_layer - 1
+        print(f"  → Built {current_layer - 2} layer(s) above Layer 2 in one call")
+    
+    while hierarchy is None and len(current_concepts) > 1:
         current_layer += 1
         print(f"\n  Aggregating to Layer {current_layer}...")
         print(f"    Current concepts ({len(current_concepts)}): {current_concepts[:5]}{'...' if len(current_concepts) > 5 else ''}")
         
-        # Aggregate concepts
-        broader_concepts = aggregate_activities_llm(current_concepts)
+        # Aggregate concepts and map them to their broader concepts in one call
+        target_count = max(1, len(current_concepts) // 2)
+        broader_concepts, mapping = await aggregate_and_map_llm(current_concepts, target_count)
         print(f"    → Aggregated to {len(broader_concepts)}: {broader_concepts}")
         
         # If aggregation didn't reduce, force reduction or break
@@ -380,52 +735,18 @@ def build_activity_tree(file_path: str) -> Dict[str, ActivityNode]:
                 break
             broader_concepts = broader_concepts[:len(current_concepts)//2]
         
-        # Map current concepts to broader concepts using LLM
+        # Apply mapping, falling back to round-robin for unmapped concepts
         concept_mapping: Dict[str, List[str]] = {bc: [] for bc in broader_concepts}
-        
-        # Use LLM to intelligently map concepts to broader categories
-        mapping_prompt = f"""You are given a list of activity concepts and a list of broader categories.
-Map each concept to the most appropriate broader category.
-
-Concepts to map:
-{json.dumps(current_concepts, indent=2)}
-
-Broader categories:
-{json.dumps(broader_concepts, indent=2)}
-
-Return ONLY a JSON object mapping each concept to a broader category. Format:
-{{"concept1": "broader_category1", "concept2": "broader_category2", ...}}
-
-Each concept should be mapped to exactly one broader category."""
-        
-        try:
-            response = call_llm(
-                mapping_prompt,
-                temperature=0.3,
-                max_tokens=512
-            )
-
-            mapping = parse_mapping_response(response)
-            
-            # Apply mapping
-            for i, concept in enumerate(current_concepts):
-                broader = mapping.get(concept.lower(), broader_concepts[i % len(broader_concepts)])
-                if broader in broader_concepts:
-                    concept_mapping[broader].append(current_concept_ids[i])
-                else:
-                    # Fallback to round-robin if mapping is invalid
-                    concept_mapping[broader_concepts[i % len(broader_concepts)]].append(current_concept_ids[i])
-        except Exception as e:
-            print(f"    Warning: LLM mapping failed ({e}), using round-robin assignment")
-            # Fallback to round-robin
-            for i, concept in enumerate(current_concepts):
-                broader_idx = i % len(broader_concepts)
-                concept_mapping[broader_concepts[broader_idx]].append(current_concept_ids[i])
+        for i, concept in enumerate(current_concepts):
+            broader = mapping.get(concept.lower())
+            if broader not in concept_mapping:
+                broader = broader_concepts[i % len(broader_concepts)]
+            concept_mapping[broader].append(current_concept_ids[i])
         
         # Create new layer nodes
         new_concept_ids = []
         for broader in broader_concepts:
-            concept_id = f"L{current_layer}_{broader.replace(' ', '_').replace('/', '_')}"
+            concept_id = f"L{current_layer}_{_slug(broader)}"
             children = concept_mapping.get(broader, [])
             
             nodes[concept_id] = ActivityNode(
@@ -446,9 +767,10 @@ Each concept should be mapped to exactly one broader category."""
         current_concepts = broader_concepts
         current_concept_ids = new_concept_ids
     
-    # Step 5: Generate final day activity
+    # Step 5: Generate final day activity (the hierarchy's root, if one was built)
     print("\n[Step 5] Generating final day activity...")
-    day_activity = generate_day_activity_llm(current_concepts)
+    if day_activity is None:
+        day_activity = await generate_day_activity_llm(current_concepts)
     print(f"  → Day's Activity: {day_activity}")
     
     day_activity_id = "day_activity"
@@ -505,6 +827,18 @@ def print_tree_summary(nodes: Dict[str, ActivityNode]):
                 print(f"  • {n.label}")
 
 
+def _node_to_dict(node: ActivityNode, truncate_content: bool = True) -> Dict:
+    """Serialize one node; content is cut to 200 chars when truncate_content."""
+    return {
+        'id': node.id,
+        'label': node.label,
+        'layer': node.layer,
+        'content': _truncate(node.content, 200) if truncate_content else node.content,
+        'children': node.children,
+        'parent': node.parent
+    }
+
+
 def tree_to_dict(nodes: Dict[str, ActivityNode], truncate_content: bool = True) -> Dict:
     """
     Convert activity graph nodes to a JSON-serializable dictionary.
@@ -516,28 +850,22 @@ def tree_to_dict(nodes: Dict[str, ActivityNode], truncate_content: bool = True)
     Returns:
         Dictionary with 'nodes' list containing serialized node data
     """
-    tree_data = {
-        'nodes': [
-            {
-                'id': node.id,
-                'label': node.label,
-                'layer': node.layer,
-                'content': (node.content[:200] + "..." if len(node.content) > 200 else node.content) if truncate_content else node.content,
-                'children': node.children,
-                'parent': node.parent
-            }
-            for node in nodes.values()
-        ]
-    }
-    return tree_data
+    return {'nodes': [_node_to_dict(node, truncate_content) for node in nodes.values()]}
 
 
 def save_tree_json(nodes: Dict[str, ActivityNode], output_path: str):
-    """Save the activity graph to a JSON file."""
-    tree_data = tree_to_dict(nodes, truncate_content=True)
+    """
+    Save the activity graph to a JSON file in the tree_to_dict format.
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(tree_data, f, indent=2, ensure_ascii=False)
+    Nodes are serialized and written one at a time (one node per line)
+    rather than building the whole tree in memory first.
+    """
+    with open(output_path, 'wb') as f:
+        f.write(b'{"nodes": [')
+        for i, node in enumerate(nodes.values()):
+            f.write(b',\n' if i else b'\n')
+            f.write(_to_json(_node_to_dict(node), indent=False).encode('utf-8'))
+        f.write(b'\n]}\n')
     
     print(f"\nTree saved to: {output_path}")
 
@@ -556,7 +884,7 @@ def main():
         sys.exit(1)
     
     # Build the activity graph
-    nodes = build_activity_tree(file_path)
+    nodes = asyncio.run(build_activity_tree(file_path))
     
     if not nodes:
         print("Failed to build activity graph.")
@@ -15,6 +15,8 @@ DATABASE_PATH = PROJECT_ROOT / "activity.db"
 # Database configuration
 DB_TABLE_ACTIVITY_LOG = "activity_log"
 DB_TABLE_KEYSTROKE_LOG = "keystroke_log"
+DB_TABLE_LLM_CACHE = "llm_cache"
+DB_POOL_SIZE = 4
 
 # Date and time formats
 DATE_FORMAT_ISO = "%Y-%m-%d"
@@ -34,24 +36,41 @@ LLM_TEMPERATURE_CONCEPT_EXTRACTION = 0.5
 LLM_TEMPERATURE_DAY_ACTIVITY = 0.7
 LLM_MAX_TOKENS_REFINEMENT = 4096
 LLM_MAX_TOKENS_CONCEPT = 256
-LLM_MAX_TOKENS_AGGREGATE = 512
+LLM_MAX_TOKENS_CONCEPT_BATCH = 4096  # Completion cap for one batched concept call
+LLM_MAX_PROMPT_TOKENS_CONCEPT_BATCH = 4096  # Estimated activity tokens packed into one batched call
+LLM_MAX_TOKENS_AGGREGATE = 1024
+LLM_MAX_TOKENS_HIERARCHY = 2048
 LLM_MAX_TOKENS_DAY = 64
+LLM_MAX_CONCURRENCY = 16
+LLM_MAX_RETRIES = 5
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_AGE_DAYS = 30  # Cached responses older than this are pruned by init_database
+LLM_MAX_SAMPLES_PER_ACTIVITY = 20
+LLM_MAX_CHARS_PER_SAMPLE = 500
+
+# Optional near-duplicate filtering of activity entries before concept
+# extraction (requires `pip install sentence-transformers`)
+ENABLE_SEMANTIC_DEDUP = False
+SEMANTIC_DEDUP_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_DEDUP_THRESHOLD = 0.85
 
 # Keystroke reconstruction
-IGNORE_KEYS = {
+IGNORE_KEYS = frozenset({
     'shift', 'shift_r', 'ctrl', 'ctrl_r', 'alt', 'alt_r', 'alt_gr',
     'cmd', 'cmd_r', 'caps_lock', 'up', 'down', 'left', 'right',
     'home', 'end', 'page_up', 'page_down', 'delete', 'escape',
     'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10', 'f11', 'f12',
     'tab', 'print_screen', 'scroll_lock', 'pause', 'insert', 'num_lock',
     'menu'
-}
+})
 
 # Activity tracking
 ACTIVITY_SAVE_INTERVAL_SECONDS = 60
+ACTIVE_APP_POLL_INTERVAL_SECONDS = 1.0  # How often the frontmost app is re-queried
 KEYSTROKE_LIMIT_DASHBOARD = 500
+WEEKLY_ACTIVITY_CACHE_SECONDS = 60  # Weekly chart payload reuse; matches the tracker's save interval
 
 # Flask configuration
 FLASK_HOST = "127.0.0.1"
 FLASK_PORT = 5000
-FLASK_DEBUG = True
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "0") == "1"  # Reloader/debugger, opt-in via FLASK_DEBUG=1
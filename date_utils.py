@@ -4,8 +4,9 @@ Date parsing and formatting utilities for Activity Tracker.
 Centralizes date/time handling logic to eliminate duplication.
 """
 
-from datetime import datetime, date
-from typing import Optional, Union
+import functools
+from datetime import datetime, date, timedelta
+from typing import Optional, Tuple, Union
 from config import DATE_FORMAT_ISO, DATE_FORMAT_DISPLAY, DATE_FORMAT_FILENAME
 
 
@@ -28,6 +29,14 @@ def parse_date_param(
     """
     if date_str:
         try:
+            # Fast path for the canonical YYYY-MM-DD form via the C ISO
+            # parser; anything else (or anything it rejects) goes through
+            # strptime so accepted inputs stay the same
+            if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+                try:
+                    return date.fromisoformat(date_str)
+                except ValueError:
+                    pass
             return datetime.strptime(date_str, DATE_FORMAT_ISO).date()
         except ValueError:
             if default_to_today:
@@ -39,6 +48,29 @@ def parse_date_param(
         return None
 
 
+def day_bounds(day: date) -> Tuple[str, str]:
+    """
+    Half-open timestamp range covering one day, for SQL range predicates.
+
+    Stored timestamps are ISO strings, so `timestamp >= start AND
+    timestamp < end` selects the same rows as `DATE(timestamp) = day`
+    while still letting SQLite use an index on timestamp.
+
+    Args:
+        day: date object
+
+    Returns:
+        (start, end) as YYYY-MM-DD strings for day and the following day
+    """
+    return day.isoformat(), (day + timedelta(days=1)).isoformat()
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_minute_display(minute: str) -> str:
+    """Display form of a 'YYYY-MM-DD HH:MM' string (the display has minute resolution)."""
+    return datetime.fromisoformat(minute).strftime(DATE_FORMAT_DISPLAY)
+
+
 def format_timestamp_display(timestamp: Union[datetime, str]) -> str:
     """
     Format timestamp for display (e.g., "8 Jan 2026 at 1:00 AM").
@@ -50,6 +82,11 @@ def format_timestamp_display(timestamp: Union[datetime, str]) -> str:
         Formatted timestamp string
     """
     if isinstance(timestamp, str):
+        # The display only shows up to the minute, so ISO strings are
+        # formatted (and cached) by their 'YYYY-MM-DD HH:MM' prefix instead
+        # of parsing the full timestamp every time
+        if len(timestamp) >= 16 and timestamp[10] in ' T' and timestamp[13] == ':':
+            return _format_minute_display(timestamp[:16])
         timestamp = datetime.fromisoformat(timestamp)
     return timestamp.strftime(DATE_FORMAT_DISPLAY)
 
@@ -4,21 +4,74 @@ Database utilities for Activity Tracker.
 Provides connection management, thread-safety, and schema initialization.
 """
 
+import queue
 import sqlite3
 from contextlib import contextmanager
-from typing import Optional
+from typing import Dict, Optional, Set
 import threading
-from config import DATABASE_PATH, DB_TABLE_ACTIVITY_LOG, DB_TABLE_KEYSTROKE_LOG
+from datetime import datetime, timedelta
+from config import (
+    DATABASE_PATH,
+    DB_POOL_SIZE,
+    DB_TABLE_ACTIVITY_LOG,
+    DB_TABLE_KEYSTROKE_LOG,
+    DB_TABLE_LLM_CACHE,
+    LLM_CACHE_MAX_AGE_DAYS
+)
 
 # Thread-local storage for connections
 _thread_local = threading.local()
 
+# Per-connection settings; journal_mode=WAL is persistent and set in init_database
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",  # ~20 MB page cache per connection (negative = KiB)
+)
+
+
+def _configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply per-connection PRAGMAs to a freshly opened connection."""
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Idle connections per database path, reused by get_db_connection
+_pools: Dict[str, "queue.LifoQueue[sqlite3.Connection]"] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(path: str) -> "queue.LifoQueue[sqlite3.Connection]":
+    """Get the idle-connection pool for a database path."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+            _pools[path] = pool
+        return pool
+
+
+def _release_connection(pool: "queue.LifoQueue[sqlite3.Connection]", conn: sqlite3.Connection) -> None:
+    """Return a connection to the pool, or close it if it is unusable or the pool is full."""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        pool.put_nowait(conn)
+    except (sqlite3.Error, queue.Full):
+        conn.close()
+
 
 @contextmanager
 def get_db_connection(row_factory: bool = True):
     """
     Context manager for database connections.
 
+    Connections are borrowed from a small per-database pool (up to
+    config.DB_POOL_SIZE idle connections) and returned on exit; any
+    uncommitted transaction is rolled back before reuse.
+
     Args:
         row_factory: If True, use Row factory for dict-like access
 
@@ -30,13 +83,19 @@ def get_db_connection(row_factory: bool = True):
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM activity_log")
     """
-    conn = sqlite3.connect(str(DATABASE_PATH))
-    if row_factory:
-        conn.row_factory = sqlite3.Row
+    path = str(DATABASE_PATH)
+    pool = _get_pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        # Pooled connections move between threads, but only one caller
+        # holds a connection at a time
+        conn = _configure_connection(sqlite3.connect(path, check_same_thread=False))
+    conn.row_factory = sqlite3.Row if row_factory else None
     try:
         yield conn
     finally:
-        conn.close()
+        _release_connection(pool, conn)
 
 
 def get_thread_local_connection() -> sqlite3.Connection:
@@ -48,13 +107,30 @@ def get_thread_local_connection() -> sqlite3.Connection:
         sqlite3.Connection: Thread-local connection
     """
     if not hasattr(_thread_local, 'conn') or _thread_local.conn is None:
-        _thread_local.conn = sqlite3.connect(
+        _thread_local.conn = _configure_connection(sqlite3.connect(
             str(DATABASE_PATH),
             check_same_thread=False
-        )
+        ))
     return _thread_local.conn
 
 
+def create_llm_cache_table(conn: sqlite3.Connection) -> None:
+    """Create the LLM response cache table if it does not exist yet."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {DB_TABLE_LLM_CACHE} (
+            key TEXT PRIMARY KEY,
+            response TEXT,
+            created_at DATETIME
+        )
+    ''')
+
+
+def _index_names(cursor: sqlite3.Cursor) -> Set[str]:
+    """Names of the indexes currently defined in the database."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    return {row[0] for row in cursor.fetchall()}
+
+
 def init_database(conn: Optional[sqlite3.Connection] = None) -> None:
     """
     Initialize database schema. Safe to call multiple times.
@@ -68,6 +144,15 @@ def init_database(conn: Optional[sqlite3.Connection] = None) -> None:
         should_close = True
 
     cursor = conn.cursor()
+    indexes_before = _index_names(cursor)
+
+    # Only takes effect before the first table is created (i.e. on a new
+    # database file); lets freed pages be reclaimed without a full VACUUM
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+    # WAL lets the dashboard read while the tracker writes; the mode is
+    # stored in the database file, so setting it once here is enough
+    cursor.execute("PRAGMA journal_mode=WAL")
 
     # Activity log table
     cursor.execute(f'''
@@ -90,7 +175,43 @@ def init_database(conn: Optional[sqlite3.Connection] = None) -> None:
         )
     ''')
 
+    # Dashboard and weekly queries read a time range of activity_log and
+    # aggregate by hour/app; with every column they touch in the index they
+    # never visit the table. Supersedes the narrower (timestamp, app_name) index
+    cursor.execute("DROP INDEX IF EXISTS idx_activity_ts_app")
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_activity_ts_covering
+        ON {DB_TABLE_ACTIVITY_LOG}(timestamp, hour, app_name, keystrokes, clicks)
+    ''')
+
+    # Export queries filter keystrokes by time range
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_keystroke_ts_app
+        ON {DB_TABLE_KEYSTROKE_LOG}(timestamp, app_name)
+    ''')
+
+    # LLM response cache (see llm_cache.py)
+    create_llm_cache_table(conn)
+
+    # Keep the cache bounded: responses are only reused for unchanged input,
+    # so old entries are unlikely to be hit again. Timestamps are bound as
+    # strings in the format the table already stores
+    cutoff = datetime.now() - timedelta(days=LLM_CACHE_MAX_AGE_DAYS)
+    cursor.execute(
+        f'DELETE FROM {DB_TABLE_LLM_CACHE} WHERE created_at < ?',
+        (cutoff.isoformat(' '),)
+    )
+
     conn.commit()
 
+    # Refresh planner statistics when the set of indexes changed (new
+    # database or a schema upgrade) so range queries pick the right index;
+    # analysis_limit samples ~1000 rows per index, keeping this fast on
+    # large databases
+    if _index_names(cursor) != indexes_before:
+        cursor.execute("PRAGMA analysis_limit=1000")
+        cursor.execute("ANALYZE")
+        conn.commit()
+
     if should_close:
         conn.close()
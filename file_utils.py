@@ -8,7 +8,6 @@ and directory creation.
 import os
 import json
 from pathlib import Path
-from typing import Optional
 from datetime import date
 from config import (
     DATA_DIR,
@@ -19,15 +18,29 @@ from config import (
 )
 from date_utils import format_date_filename
 
+try:
+    import orjson
+except ImportError:  # optional accelerator; fall back to the stdlib json module
+    orjson = None
+
+
+# Set once the data directory is known to exist, so later calls skip mkdir
+_data_dir_ready = False
+
 
 def ensure_data_directory() -> Path:
     """
     Ensure the data directory exists. Create if needed.
 
+    The check runs once per process; later calls return immediately.
+
     Returns:
         Path object for data directory
     """
-    DATA_DIR.mkdir(exist_ok=True)
+    global _data_dir_ready
+    if not _data_dir_ready:
+        DATA_DIR.mkdir(exist_ok=True)
+        _data_dir_ready = True
     return DATA_DIR
 
 
@@ -53,22 +66,6 @@ def get_keystroke_export_filename(date_obj: date, refined: bool = False) -> str:
         return FILENAME_KEYSTROKE_EXPORT.format(date=format_date_filename(date_obj))
 
 
-def read_text_file(file_path: Path) -> Optional[str]:
-    """
-    Safely read text file.
-
-    Returns:
-        File content or None if file doesn't exist or error occurs
-    """
-    try:
-        if file_path.exists():
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-    return None
-
-
 def write_text_file(file_path: Path, content: str) -> bool:
     """
     Safely write text file.
@@ -78,30 +75,17 @@ def write_text_file(file_path: Path, content: str) -> bool:
     """
     try:
         ensure_data_directory()
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Encode once and write the bytes in one call through a 1 MiB
+        # buffer instead of the text layer's 8 KB chunks
+        data = content.encode('utf-8')
+        with open(file_path, 'wb', buffering=1 << 20) as f:
+            f.write(data)
         return True
     except Exception as e:
         print(f"Error writing file {file_path}: {e}")
         return False
 
 
-def read_json_file(file_path: Path) -> Optional[dict]:
-    """
-    Safely read JSON file.
-
-    Returns:
-        Parsed JSON dict or None if error occurs
-    """
-    try:
-        if file_path.exists():
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error reading JSON file {file_path}: {e}")
-    return None
-
-
 def write_json_file(file_path: Path, data: dict) -> bool:
     """
     Safely write JSON file.
@@ -111,8 +95,15 @@ def write_json_file(file_path: Path, data: dict) -> bool:
     """
     try:
         ensure_data_directory()
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            # One encode and one write() for the whole document
+            with open(file_path, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            # Stream the encoder's chunks through a 1 MiB buffer rather than
+            # building the whole document as one string first
+            with open(file_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         return True
     except Exception as e:
         print(f"Error writing JSON file {file_path}: {e}")
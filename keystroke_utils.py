@@ -5,12 +5,32 @@ Provides functions to reconstruct text from keystroke logs and format
 grouped keystrokes for display or export.
 """
 
-from typing import List, Dict, Tuple
+from typing import List, Iterable, Iterator, Tuple
 from datetime import datetime
 from config import IGNORE_KEYS
 from date_utils import format_timestamp_display
 
 
+# Text inserted for each named key (backspace, enter, ...); ignored keys
+# insert nothing and _POP deletes the previous character. Names are stored
+# lowercased plus their common casings so most lookups skip key.lower();
+# single-character keys are always inserted as typed and unknown names
+# are dropped
+_POP = object()
+_KEY_ACTIONS_LOWER = {
+    'backspace': _POP,
+    'space': ' ',
+    'enter': '\n',
+    'return': '\n',
+    **{key: '' for key in IGNORE_KEYS},
+}
+_KEY_ACTIONS = {
+    variant: action
+    for name, action in _KEY_ACTIONS_LOWER.items()
+    for variant in (name, name.capitalize(), name.upper())
+}
+
+
 def reconstruct_text(keystrokes: List[str]) -> str:
     """
     Reconstruct readable text from a list of keystroke strings.
@@ -22,103 +42,68 @@ def reconstruct_text(keystrokes: List[str]) -> str:
         Reconstructed text string
     """
     result = []
+    append = result.append
+    actions = _KEY_ACTIONS
     for key in keystrokes:
-        key_lower = key.lower()
-
-        # Skip ignored keys
-        if key_lower in IGNORE_KEYS:
+        if len(key) == 1:
+            # Regular character (the common case)
+            append(key)
             continue
 
-        # Handle special keys
-        if key_lower == 'backspace':
+        action = actions.get(key)
+        if action is None:
+            action = _KEY_ACTIONS_LOWER.get(key.lower())
+        if action is _POP:
             if result:
                 result.pop()
-        elif key_lower == 'space':
-            result.append(' ')
-        elif key_lower in ('enter', 'return'):
-            result.append('\n')
-        elif len(key) == 1:
-            # Regular character
-            result.append(key)
+        elif action:
+            append(action)
 
     return ''.join(result)
 
 
-def group_keystrokes_by_app(
-    keystrokes: List[Dict]
-) -> List[Tuple[str, str, List[str]]]:
-    """
-    Group keystrokes by application changes.
+def _format_group(timestamp: str, app_name: str, keys: List[str]) -> str:
+    """Format one app group: timestamp, [app name], reconstructed text, each on its own line."""
+    reconstructed = reconstruct_text(keys)
+    if not reconstructed.strip():
+        reconstructed = "(App switch activity)"
+    return f"{format_timestamp_display(timestamp)}\n[{app_name}]\n{reconstructed}\n"
 
-    Args:
-        keystrokes: List of dicts with 'timestamp', 'key_pressed', 'app_name' keys
 
-    Returns:
-        List of tuples: (timestamp, app_name, [keys])
-
-    Example:
-        >>> keystrokes = [
-        ...     {'timestamp': '2026-01-08 10:00:00', 'key_pressed': 'h', 'app_name': 'Terminal'},
-        ...     {'timestamp': '2026-01-08 10:00:01', 'key_pressed': 'i', 'app_name': 'Terminal'},
-        ... ]
-        >>> group_keystrokes_by_app(keystrokes)
-        [('2026-01-08 10:00:00', 'Terminal', ['h', 'i'])]
+def iter_format_keystroke_rows(rows: Iterable[Tuple[str, str, str]]) -> Iterator[str]:
     """
-    if not keystrokes:
-        return []
-
-    groups = []
-    current_app = None
-    current_keys = []
-    current_timestamp = None
-
-    for ks in keystrokes:
-        # When app changes, save previous group
-        if current_app is not None and ks['app_name'] != current_app:
-            if current_timestamp:
-                groups.append((current_timestamp, current_app, current_keys))
-            current_keys = []
-
-        # Update current app and add key
-        if current_app != ks['app_name']:
-            current_app = ks['app_name']
-            current_timestamp = ks['timestamp']
-
-        current_keys.append(ks['key_pressed'])
+    Group keystrokes by app and yield the formatted text one group at a time.
 
-    # Add last group
-    if current_app is not None and current_timestamp:
-        groups.append((current_timestamp, current_app, current_keys))
-
-    return groups
-
-
-def format_keystroke_groups(
-    groups: List[Tuple[str, str, List[str]]]
-) -> str:
-    """
-    Format grouped keystrokes into readable text output.
+    Only the current group's keys are held at any point, so this suits
+    streaming a large export straight to the client.
 
     Args:
-        groups: List of tuples from group_keystrokes_by_app()
+        rows: (timestamp, key_pressed, app_name) tuples in time order, e.g.
+            straight from a cursor without a row factory
 
-    Returns:
-        Formatted text with timestamps, app names, and reconstructed text
+    Yields:
+        Formatted text for each group (timestamp, app name, reconstructed text)
     """
-    output_lines = []
-
-    for timestamp, app_name, keys in groups:
-        reconstructed = reconstruct_text(keys)
-        has_text = reconstructed.strip()
-
-        formatted_time = format_timestamp_display(timestamp)
-        output_lines.append(formatted_time)
-        output_lines.append(f"[{app_name}]")
-
-        if has_text:
-            output_lines.append(reconstructed)
-        else:
-            output_lines.append("(App switch activity)")
-        output_lines.append("")  # Empty line between groups
+    current_app = None
+    current_timestamp = None
+    current_keys = []
+    # Groups are separated by a blank line
+    separator = ''
+
+    for timestamp, key, app_name in rows:
+        # When the app changes, format the previous group. Keys typed under
+        # a None app have no group of their own: they are carried into the
+        # next app's group (or dropped if none follows)
+        if app_name != current_app:
+            if current_app is not None:
+                if current_timestamp:
+                    yield separator + _format_group(current_timestamp, current_app, current_keys)
+                    separator = '\n'
+                current_keys = []
+            current_app = app_name
+            current_timestamp = timestamp
+
+        current_keys.append(key)
 
-    return '\n'.join(output_lines)
+    if current_app is not None and current_timestamp:
+        yield separator + _format_group(current_timestamp, current_app, current_keys)
@@ -0,0 +1,95 @@
+"""
+LLM response cache for Activity Tracker.
+
+Persists LLM responses in the SQLite database keyed by a hash of the
+request, so reruns over unchanged input skip the network round-trip.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config import DB_TABLE_LLM_CACHE
+from db_utils import get_db_connection, create_llm_cache_table
+
+_table_ready = False
+# Cache lookups can run on worker threads (see llm_utils.call_llm_async)
+_table_lock = threading.Lock()
+
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: int
+) -> str:
+    """
+    Build a stable cache key for an LLM request.
+
+    Returns:
+        Hex digest identifying the request
+    """
+    payload = json.dumps(
+        {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=32).hexdigest()
+
+
+def _ensure_table() -> None:
+    """
+    Create the cache table on first use (older databases predate it).
+
+    Only the table is created here; the rest of the schema, and pruning of
+    old entries, is left to init_database() at startup.
+    """
+    global _table_ready
+    if not _table_ready:
+        with _table_lock:
+            if not _table_ready:
+                with get_db_connection(row_factory=False) as conn:
+                    create_llm_cache_table(conn)
+                    conn.commit()
+                _table_ready = True
+
+
+def get_cached_response(key: str) -> Optional[str]:
+    """
+    Look up a cached LLM response.
+
+    Returns:
+        Cached response text, or None on a miss or database error
+    """
+    try:
+        _ensure_table()
+        with get_db_connection(row_factory=False) as conn:
+            row = conn.execute(
+                f'SELECT response FROM {DB_TABLE_LLM_CACHE} WHERE key = ?',
+                (key,)
+            ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"Warning: LLM cache lookup failed: {e}")
+        return None
+
+
+def set_cached_response(key: str, response: str) -> None:
+    """Store an LLM response. Errors are logged and otherwise ignored."""
+    try:
+        _ensure_table()
+        with get_db_connection(row_factory=False) as conn:
+            conn.execute(
+                f'INSERT OR REPLACE INTO {DB_TABLE_LLM_CACHE} (key, response, created_at) VALUES (?, ?, ?)',
+                (key, response, datetime.now().isoformat(' '))
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Warning: LLM cache write failed: {e}")
@@ -5,18 +5,16 @@ Uses Groq's Llama 3.3 70B model to refine raw keystroke text into a cleaner,
 structured format with timestamps and app context.
 """
 
-import os
-from dotenv import load_dotenv
+from typing import Iterator, List
 from llm_utils import get_groq_client
+from llm_cache import make_cache_key, get_cached_response, set_cached_response
 from config import (
     LLM_MODEL_NAME,
     LLM_TEMPERATURE_REFINEMENT,
-    LLM_MAX_TOKENS_REFINEMENT
+    LLM_MAX_TOKENS_REFINEMENT,
+    LLM_CACHE_ENABLED
 )
 
-# Load environment variables from .env file
-load_dotenv()
-
 SYSTEM_PROMPT = """You are a text refinement assistant. Your task is to take raw keystroke logs and transform them into clean, readable text.
 
 The input will contain timestamps and raw text captured from keystrokes across different applications.
@@ -38,10 +36,33 @@ Rules:
 9. Do not add any commentary or explanations - only output the refined text
 10. Preserve line breaks where they make sense (e.g., separate commands, paragraphs)"""
 
+# The system message is identical for every request, so build it once
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def _build_messages(raw_text: str) -> List[dict]:
+    """Chat messages asking the model to refine raw_text."""
+    return [
+        _SYSTEM_MESSAGE,
+        {
+            "role": "user",
+            "content": f"Please refine the following raw keystroke log:\n\n{raw_text}"
+        }
+    ]
+
+
+def _cache_key(messages: List[dict]) -> str:
+    """LLM cache key for a refinement request (see llm_cache)."""
+    return make_cache_key(
+        LLM_MODEL_NAME, messages, LLM_TEMPERATURE_REFINEMENT, LLM_MAX_TOKENS_REFINEMENT
+    )
+
 
 def refine_text(raw_text: str) -> str:
     """
     Refine raw keystroke text using Groq's LLM.
+    Responses are served from the LLM cache when config.LLM_CACHE_ENABLED,
+    so refining the same text again skips the model call.
     
     Args:
         raw_text: Raw text reconstructed from keystrokes
@@ -52,26 +73,28 @@ def refine_text(raw_text: str) -> str:
     if not raw_text or not raw_text.strip():
         return raw_text
     
+    messages = _build_messages(raw_text)
+    cache_key = _cache_key(messages)
+    if LLM_CACHE_ENABLED:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+    
     try:
         client = get_groq_client()
         chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": f"Please refine the following raw keystroke log:\n\n{raw_text}"
-                }
-            ],
+            messages=messages,
             model=LLM_MODEL_NAME,
             temperature=LLM_TEMPERATURE_REFINEMENT,
             max_completion_tokens=LLM_MAX_TOKENS_REFINEMENT,
         )
         
         refined = chat_completion.choices[0].message.content
-        return refined if refined else raw_text
+        if not refined:
+            return raw_text
+        if LLM_CACHE_ENABLED:
+            set_cached_response(cache_key, refined)
+        return refined
         
     except Exception as e:
         # If LLM call fails, return original text with error note
@@ -79,6 +102,63 @@ def refine_text(raw_text: str) -> str:
         return f"[Refinement failed: {str(e)}]\n\n{raw_text}"
 
 
+def refine_text_stream(raw_text: str) -> Iterator[str]:
+    """
+    Streaming variant of refine_text: yields the refined text in chunks as
+    the model generates it, so callers can forward or write output before
+    the completion has finished.
+    
+    Falls back like refine_text: the raw text is yielded if the model
+    returns nothing, and an error note plus the raw text if the call fails
+    before any output. If the stream fails part-way, it ends with a short
+    interruption note instead, and the partial text is not cached.
+    Shares refine_text's cache: a cached refinement is yielded whole, and a
+    completed stream is stored for next time.
+    """
+    if not raw_text or not raw_text.strip():
+        if raw_text:
+            yield raw_text
+        return
+    
+    messages = _build_messages(raw_text)
+    cache_key = _cache_key(messages)
+    if LLM_CACHE_ENABLED:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    parts = []
+    try:
+        client = get_groq_client()
+        with client.chat.completions.create(
+            messages=messages,
+            model=LLM_MODEL_NAME,
+            temperature=LLM_TEMPERATURE_REFINEMENT,
+            max_completion_tokens=LLM_MAX_TOKENS_REFINEMENT,
+            stream=True,
+        ) as stream:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        
+        if not parts:
+            yield raw_text
+        elif LLM_CACHE_ENABLED:
+            set_cached_response(cache_key, ''.join(parts))
+        
+    except Exception as e:
+        print(f"LLM refinement failed: {e}")
+        if parts:
+            # Refined text has already gone out; appending the raw log would
+            # duplicate it, so just mark where the output stops
+            yield f"\n\n[Refinement interrupted: {str(e)}]"
+        else:
+            yield f"[Refinement failed: {str(e)}]\n\n{raw_text}"
+
+
 if __name__ == "__main__":
     # Test the refiner with sample text
     sample = """8 Jan 2026 at 1:00 AM
@@ -4,12 +4,21 @@ LLM utilities and response parsing for Activity Tracker.
 Centralizes all LLM interaction, response parsing, and error handling.
 """
 
+import re
 import json
+import asyncio
+import random
+import weakref
+import functools
 from typing import List, Dict, Any, Optional
-from groq import Groq
+from dotenv import load_dotenv
+from groq import Groq, AsyncGroq, APIConnectionError, APIStatusError
 import os
 from config import (
     LLM_MODEL_NAME,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_CACHE_ENABLED,
     LLM_TEMPERATURE_REFINEMENT,
     LLM_TEMPERATURE_CONCEPT_EXTRACTION,
     LLM_TEMPERATURE_DAY_ACTIVITY,
@@ -18,13 +27,88 @@ from config import (
     LLM_MAX_TOKENS_AGGREGATE,
     LLM_MAX_TOKENS_DAY
 )
+from llm_cache import make_cache_key, get_cached_response, set_cached_response
 
+# Body of a leading markdown code fence, up to the closing fence or the end
+# of the text (streamed responses may stop before the closing fence)
+_FENCE_RE = re.compile(r'```(?:json)?(.*?)(?:```|\Z)', re.S)
 
+# What may precede a streamed JSON value: whitespace and an optional opening
+# code fence. _JSON_PREFIX_RE also accepts a fence that is still arriving.
+_JSON_START_RE = re.compile(r'\s*(?:```[a-z]*\s*)?', re.I)
+_JSON_PREFIX_RE = re.compile(r'\s*(?:`{1,2}|```[a-z]*\s*)?', re.I)
+
+# One item of a comma/newline separated list
+_LIST_ITEM_RE = re.compile(r'[^,\n]+')
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # optional accelerator; fall back to the stdlib json module
+    _json_loads = json.loads
+
+
+@functools.lru_cache(maxsize=None)
+def _load_env() -> None:
+    """Load .env once, on first client use rather than at import."""
+    load_dotenv()
+
+
+@functools.lru_cache(maxsize=None)
 def get_groq_client() -> Groq:
-    """Get initialized Groq client."""
+    """Get the shared Groq client, creating it on first use."""
+    _load_env()
     return Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
 
+# The async client's HTTP pool belongs to the event loop it was created on,
+# so cache one client per running loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGroq]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_groq_client() -> AsyncGroq:
+    """Get the async Groq client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        _load_env()
+        client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_groq_client() -> None:
+    """Close the running loop's async Groq client (and its HTTP pool), if one was created."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+# asyncio primitives bind to the loop they are first used on, so keep one
+# semaphore per running event loop (each asyncio.run() gets its own)
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding in-flight LLM requests on the running loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and connection failures are worth retrying."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return error.status_code == 429 or error.status_code >= 500
+
+
 def parse_json_response(response: str, fallback_parser=None) -> Any:
     """
     Parse LLM JSON response, handling markdown code blocks.
@@ -43,18 +127,13 @@ def parse_json_response(response: str, fallback_parser=None) -> Any:
     """
     response = response.strip()
 
-    # Handle markdown code blocks
+    # Handle markdown code blocks (and the optional "json" language identifier)
     if response.startswith("```"):
-        parts = response.split("```")
-        if len(parts) >= 2:
-            response = parts[1]
-            # Remove language identifier (e.g., "json")
-            if response.startswith("json"):
-                response = response[4:]
-            response = response.strip()
+        response = _FENCE_RE.match(response).group(1).strip()
 
     try:
-        return json.loads(response)
+        # orjson's decode error subclasses json.JSONDecodeError
+        return _json_loads(response)
     except json.JSONDecodeError:
         if fallback_parser:
             return fallback_parser(response)
@@ -66,10 +145,10 @@ def parse_list_response_fallback(response: str) -> List[str]:
     Fallback parser for list responses when JSON parsing fails.
     Splits by newlines or commas and cleans up.
     """
-    items = [
-        item.strip().strip('"\'[]')
-        for item in response.replace('\n', ',').split(',')
-    ]
+    items = (
+        match.group().strip().strip('"\'[]')
+        for match in _LIST_ITEM_RE.finditer(response)
+    )
     return [item.lower() for item in items if item]
 
 
@@ -81,6 +160,7 @@ def call_llm(
 ) -> str:
     """
     Call Groq LLM with standard error handling.
+    Responses are served from the LLM cache when config.LLM_CACHE_ENABLED.
 
     Args:
         prompt: User prompt text
@@ -97,16 +177,167 @@ def call_llm(
     if model is None:
         model = LLM_MODEL_NAME
 
+    messages = [{"role": "user", "content": prompt}]
+    cache_key = make_cache_key(model, messages, temperature, max_tokens)
+    if LLM_CACHE_ENABLED:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
     client = get_groq_client()
 
     completion = client.chat.completions.create(
         model=model,
-        messages=[{"role": "user", "content": prompt}],
+        messages=messages,
         temperature=temperature,
         max_completion_tokens=max_tokens,
     )
 
-    return completion.choices[0].message.content.strip()
+    content = completion.choices[0].message.content.strip()
+    if LLM_CACHE_ENABLED:
+        set_cached_response(cache_key, content)
+    return content
+
+
+class _JsonEndDetector:
+    """
+    Scans streamed response text and reports when its JSON array/object
+    closes. Tracking only starts if the value opens the response (after
+    whitespace or a leading ``` fence); any other response, e.g. prose that
+    happens to contain brackets, is read to the end. Brackets inside JSON
+    strings are ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.prefix = ""
+        self.gave_up = False
+
+    def feed(self, text: str) -> bool:
+        """Consume the next chunk; True once the JSON value is complete."""
+        if self.gave_up:
+            return False
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif self.depth == 0:
+                if ch in '[{' and _JSON_START_RE.fullmatch(self.prefix):
+                    self.depth = 1
+                    continue
+                # Text before the JSON value may only be whitespace or a fence
+                self.prefix += ch
+                if not _JSON_PREFIX_RE.fullmatch(self.prefix):
+                    self.gave_up = True
+                    return False
+            elif ch in '[{':
+                self.depth += 1
+            elif ch == '"':
+                self.in_string = True
+            elif ch in ']}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+async def _stream_until_json_end(client: AsyncGroq, **params) -> str:
+    """
+    Stream a completion and stop reading as soon as its JSON value closes,
+    closing the stream so the rest of the generation is not waited on.
+    """
+    stream = await client.chat.completions.create(stream=True, **params)
+    detector = _JsonEndDetector()
+    parts = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                if detector.feed(delta):
+                    break
+    finally:
+        await stream.close()
+    return "".join(parts)
+
+
+async def call_llm_async(
+    prompt: str,
+    temperature: float = 0.5,
+    max_tokens: int = 256,
+    model: Optional[str] = None,
+    stop_at_json_end: bool = False
+) -> str:
+    """
+    Async variant of call_llm, for fanning out independent requests
+    concurrently with asyncio.gather.
+
+    At most config.LLM_MAX_CONCURRENCY requests are in flight at once, and
+    rate-limit/server errors are retried with exponential backoff up to
+    config.LLM_MAX_RETRIES attempts. Responses are served from the LLM cache
+    when config.LLM_CACHE_ENABLED.
+
+    Args:
+        prompt: User prompt text
+        temperature: Sampling temperature (0.0-1.0)
+        max_tokens: Maximum completion tokens
+        model: Model name (defaults to config.LLM_MODEL_NAME)
+        stop_at_json_end: Stream the response and stop as soon as the JSON
+            array/object that opens it is complete (for prompts that ask for
+            JSON only)
+
+    Returns:
+        LLM response text
+
+    Raises:
+        Exception: If LLM call fails
+    """
+    if model is None:
+        model = LLM_MODEL_NAME
+
+    messages = [{"role": "user", "content": prompt}]
+    cache_key = make_cache_key(model, messages, temperature, max_tokens)
+    # The cache is a blocking sqlite call; run it on a worker thread so the
+    # other requests in a gather() keep going
+    if LLM_CACHE_ENABLED:
+        cached = await asyncio.to_thread(get_cached_response, cache_key)
+        if cached is not None:
+            return cached
+
+    client = get_async_groq_client()
+    semaphore = _get_llm_semaphore()
+
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            params = dict(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_completion_tokens=max_tokens,
+            )
+            async with semaphore:
+                if stop_at_json_end:
+                    content = await _stream_until_json_end(client, **params)
+                else:
+                    completion = await client.chat.completions.create(**params)
+                    content = completion.choices[0].message.content
+            content = content.strip()
+            if LLM_CACHE_ENABLED:
+                await asyncio.to_thread(set_cached_response, cache_key, content)
+            return content
+        except (APIConnectionError, APIStatusError) as e:
+            if not _is_retryable(e) or attempt == LLM_MAX_RETRIES - 1:
+                raise
+            # Back off outside the semaphore so other requests can proceed
+            await asyncio.sleep(2 ** attempt + random.random())
 
 
 def extract_concepts_from_llm(prompt: str) -> List[str]:
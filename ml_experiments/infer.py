@@ -1,11 +1,20 @@
 import torch
+import torch.nn as nn
 import argparse
+import contextlib
 import os
 import random
 from model import GPT
 
+def _autocast(device):
+    """BF16 autocast on CUDA (FP16 if the GPU lacks BF16); FP32 elsewhere."""
+    if str(device).startswith('cuda'):
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return torch.autocast(device_type='cuda', dtype=dtype)
+    return contextlib.nullcontext()
+
 # Inference function
-def inference(checkpoint_path, prompt="", max_new_tokens=200, temperature=0.8, top_k=50):
+def inference(checkpoint_path, prompt="", max_new_tokens=200, temperature=0.8, top_k=50, quantize=False):
     # If checkpoint_path is just a filename, look in models directory
     # If it's an absolute path or contains directory, use it as-is
     if not os.path.isabs(checkpoint_path) and os.path.dirname(checkpoint_path) == '':
@@ -28,6 +37,17 @@ def inference(checkpoint_path, prompt="", max_new_tokens=200, temperature=0.8, t
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
     
+    # Optional int8 dynamic quantization of the Linear layers for CPU runs.
+    # Pays off for wider models; at the default n_embd=128 the
+    # quantize/dequantize overhead outweighs the smaller matmuls
+    if quantize and str(config.device) == 'cpu':
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    
+    # Fuse attention/MLP kernels on GPU. Compile forward (generate calls it)
+    # with dynamic shapes, since the context grows on every step
+    if str(config.device).startswith('cuda'):
+        model.forward = torch.compile(model.forward, dynamic=True)
+    
     # Prepare prompt
     if prompt:
         idx = torch.tensor([tokenizer.encode(prompt)], device=config.device)
@@ -40,7 +60,7 @@ def inference(checkpoint_path, prompt="", max_new_tokens=200, temperature=0.8, t
     print("-" * 50)
     
     # Generate
-    with torch.no_grad():
+    with torch.no_grad(), _autocast(config.device):
         generated = model.generate(idx, max_new_tokens, temperature, top_k)
         output = tokenizer.decode(generated[0].tolist())
     
@@ -58,6 +78,7 @@ def main():
     parser.add_argument('--max-tokens', type=int, default=200, help='Max tokens to generate')
     parser.add_argument('--temperature', type=float, default=0.8, help='Sampling temperature')
     parser.add_argument('--top-k', type=int, default=50, help='Top-k sampling')
+    parser.add_argument('--quantize', action='store_true', help='Use int8 dynamic quantization for CPU inference')
     
     args = parser.parse_args()
     
@@ -75,7 +96,8 @@ def main():
         prompt=prompt,
         max_new_tokens=args.max_tokens,
         temperature=args.temperature,
-        top_k=args.top_k
+        top_k=args.top_k,
+        quantize=args.quantize
     )
 
 if __name__ == '__main__':
@@ -1,23 +1,28 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from torch.utils.data import Dataset
 
 # Configuration
 class Config:
     # Model
     vocab_size = None  # Set from data
+    padded_vocab_size = None  # Embedding/lm_head rows, rounded up for tensor cores (None: vocab_size)
     n_embd = 128
     n_head = 4
     n_layer = 4
     block_size = 128
     dropout = 0.1
+    tie_weights = False  # Share token_embedding and lm_head weights (no lm_head bias)
     
     # Training
     batch_size = 64
     learning_rate = 3e-4
     max_iters = 5000
     eval_interval = 500
+    grad_checkpoint = False  # Recompute block activations in backward to save memory
     
     # System
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -30,37 +35,121 @@ class CharTokenizer:
         self.stoi = {ch: i for i, ch in enumerate(chars)}
         self.itos = {i: ch for i, ch in enumerate(chars)}
     
+    def __getstate__(self):
+        # Lookup tables are rebuilt on demand, so keep them out of checkpoints
+        state = self.__dict__.copy()
+        state.pop('_encode_lut', None)
+        state.pop('_decode_lut', None)
+        return state
+    
+    def _luts(self):
+        """
+        Code point -> token id (-1 if not in vocab) and token id -> code point
+        arrays, built on first use (older pickled tokenizers lack them).
+        """
+        if getattr(self, '_encode_lut', None) is None:
+            code_points = np.array([ord(self.itos[i]) for i in range(self.vocab_size)], dtype=np.uint32)
+            encode_lut = np.full(int(code_points.max()) + 1, -1, dtype=np.int64)
+            encode_lut[code_points] = np.arange(self.vocab_size)
+            self._encode_lut, self._decode_lut = encode_lut, code_points
+        return self._encode_lut, self._decode_lut
+    
+    def encode_array(self, s, chunk_size=1 << 20):
+        """
+        Encode to an int64 NumPy array (wrap with torch.from_numpy without copying).
+        
+        Long texts are converted chunk_size characters at a time into one
+        preallocated array, so the UTF-32 and lookup temporaries stay small
+        instead of scaling with the whole corpus.
+        """
+        encode_lut, _ = self._luts()
+        ids = np.empty(len(s), dtype=np.int64)
+        for start in range(0, len(s), chunk_size):
+            chunk = s[start:start + chunk_size]
+            code_points = np.frombuffer(chunk.encode('utf-32-le'), dtype=np.uint32)
+            chunk_ids = encode_lut[np.minimum(code_points, len(encode_lut) - 1)]
+            unknown = (chunk_ids < 0) | (code_points >= len(encode_lut))
+            if unknown.any():
+                raise KeyError(chunk[int(unknown.argmax())])
+            ids[start:start + len(chunk)] = chunk_ids
+        return ids
+    
     def encode(self, s):
-        return [self.stoi[c] for c in s]
+        return self.encode_array(s).tolist()
     
     def decode(self, l):
-        return ''.join([self.itos[i] for i in l])
+        _, decode_lut = self._luts()
+        return decode_lut[np.asarray(l, dtype=np.int64)].tobytes().decode('utf-32-le')
 
 # Dataset
 class TextDataset(Dataset):
     def __init__(self, data, block_size):
-        self.data = data
+        # One contiguous tensor up front; samples are views into it
+        self.data = torch.as_tensor(data, dtype=torch.long)
         self.block_size = block_size
     
     def __len__(self):
         return len(self.data) - self.block_size
     
     def __getitem__(self, idx):
-        x = torch.tensor(self.data[idx:idx + self.block_size], dtype=torch.long)
-        y = torch.tensor(self.data[idx + 1:idx + self.block_size + 1], dtype=torch.long)
+        x = self.data[idx:idx + self.block_size]
+        y = self.data[idx + 1:idx + self.block_size + 1]
         return x, y
 
 # Model
+class CausalSelfAttention(nn.Module):
+    """
+    Multi-head causal self-attention on F.scaled_dot_product_attention, with
+    an optional per-layer KV cache for incremental decoding.
+    
+    Parameters keep nn.MultiheadAttention's names and packed QKV layout
+    (in_proj_weight, in_proj_bias, out_proj) so existing checkpoints load.
+    """
+    def __init__(self, config):
+        super().__init__()
+        self.n_head = config.n_head
+        self.dropout = config.dropout
+        self.in_proj_weight = nn.Parameter(torch.empty(3 * config.n_embd, config.n_embd))
+        self.in_proj_bias = nn.Parameter(torch.zeros(3 * config.n_embd))
+        self.out_proj = nn.Linear(config.n_embd, config.n_embd)
+        nn.init.xavier_uniform_(self.in_proj_weight)
+    
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
+        B, T, C = x.shape
+        head_dim = C // self.n_head
+        
+        # (B, T, C) -> 3 x (B, n_head, T, head_dim)
+        q, k, v = F.linear(x, self.in_proj_weight, self.in_proj_bias).split(C, dim=2)
+        q = q.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        k = k.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        v = v.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        
+        # Prepend cached keys/values of earlier positions, then cache the result
+        past = kv_cache[layer_idx] if kv_cache is not None else None
+        if past is not None:
+            k = torch.cat((past[0], k), dim=2)
+            v = torch.cat((past[1], v), dim=2)
+        if kv_cache is not None:
+            kv_cache[layer_idx] = (k, v)
+        
+        # Without a cache the kernel applies the causal mask itself; with
+        # one, GPT.forward passes the offset mask (None for a single token)
+        is_causal = past is None and T > 1
+        
+        y = F.scaled_dot_product_attention(
+            q, k, v,
+            attn_mask=attn_mask,
+            dropout_p=self.dropout if self.training else 0.0,
+            is_causal=is_causal
+        )
+        y = y.transpose(1, 2).contiguous().view(B, T, C)
+        return self.out_proj(y)
+
 class TransformerBlock(nn.Module):
     def __init__(self, config):
         super().__init__()
         self.ln1 = nn.LayerNorm(config.n_embd)
-        self.attn = nn.MultiheadAttention(
-            embed_dim=config.n_embd,
-            num_heads=config.n_head,
-            dropout=config.dropout,
-            batch_first=True
-        )
+        self.attn = CausalSelfAttention(config)
         self.ln2 = nn.LayerNorm(config.n_embd)
         self.mlp = nn.Sequential(
             nn.Linear(config.n_embd, 4 * config.n_embd),
@@ -69,35 +158,48 @@ class TransformerBlock(nn.Module):
             nn.Dropout(config.dropout),
         )
     
-    def forward(self, x):
-        # Self-attention with causal mask
-        x_norm = self.ln1(x)
-        
-        # Create causal mask for the sequence length
-        seq_len = x_norm.size(1)
-        causal_mask = torch.triu(torch.ones(seq_len, seq_len, device=x.device, dtype=torch.bool), diagonal=1)
-        
-        attn_out, _ = self.attn(
-            x_norm, x_norm, x_norm,
-            need_weights=False,
-            attn_mask=causal_mask
-        )
-        x = x + attn_out
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
+        # Self-attention (causal)
+        x = x + self.attn(self.ln1(x), kv_cache, layer_idx, attn_mask)
         
         # Feed-forward
         x = x + self.mlp(self.ln2(x))
         return x
 
+def _gumbel_argmax(logits):
+    """
+    Draw one index per row from softmax(logits) via the Gumbel-max trick:
+    argmax(logits + Gumbel noise) is one pointwise op and one reduction, with
+    no probability tensor or multinomial scan. Runs in FP32 so noise drawn
+    under bf16/fp16 autocast keeps full resolution.
+    """
+    logits = logits.float()
+    gumbel = -torch.log(-torch.log(torch.rand_like(logits).clamp_min(1e-9)))
+    return (logits + gumbel).argmax(dim=-1, keepdim=True)
+
 class GPT(nn.Module):
     def __init__(self, config):
         super().__init__()
         self.config = config
         
-        self.token_embedding = nn.Embedding(config.vocab_size, config.n_embd)
+        # Rows past vocab_size are padding; their logits are masked in forward
+        n_vocab = config.padded_vocab_size or config.vocab_size
+        self.token_embedding = nn.Embedding(n_vocab, config.n_embd)
         self.position_embedding = nn.Embedding(config.block_size, config.n_embd)
-        self.blocks = nn.Sequential(*[TransformerBlock(config) for _ in range(config.n_layer)])
+        self.blocks = nn.ModuleList([TransformerBlock(config) for _ in range(config.n_layer)])
         self.ln_f = nn.LayerNorm(config.n_embd)
-        self.lm_head = nn.Linear(config.n_embd, config.vocab_size)
+        self.lm_head = nn.Linear(config.n_embd, n_vocab, bias=not config.tie_weights)
+        if config.tie_weights:
+            self.lm_head.weight = self.token_embedding.weight
+        
+        # Allowed (query, key) positions and position ids, built once and
+        # sliced per call; not saved in checkpoints
+        self.register_buffer(
+            'causal_mask',
+            torch.tril(torch.ones(config.block_size, config.block_size, dtype=torch.bool)),
+            persistent=False
+        )
+        self.register_buffer('pos_ids', torch.arange(config.block_size), persistent=False)
         
         self.apply(self._init_weights)
     
@@ -106,19 +208,41 @@ class GPT(nn.Module):
             module.weight.data.normal_(mean=0.0, std=0.02)
             if isinstance(module, nn.Linear) and module.bias is not None:
                 module.bias.data.zero_()
+        elif isinstance(module, CausalSelfAttention):
+            # Packed QKV projection: same init as the other linear layers
+            module.in_proj_weight.data.normal_(mean=0.0, std=0.02)
+            module.in_proj_bias.data.zero_()
     
-    def forward(self, idx, targets=None):
+    def forward(self, idx, targets=None, kv_cache=None):
+        """
+        kv_cache: optional list with one entry per block (None when empty),
+        updated in place with each block's keys/values; idx then holds only
+        the positions after the cached ones.
+        """
         B, T = idx.shape
+        past_len = kv_cache[0][0].size(2) if kv_cache is not None and kv_cache[0] is not None else 0
         
         # Embeddings
         tok_emb = self.token_embedding(idx)
-        pos_emb = self.position_embedding(torch.arange(T, device=idx.device))
+        pos_emb = self.position_embedding(self.pos_ids[past_len:past_len + T])
         x = tok_emb + pos_emb
         
+        # Several new tokens after cached ones: each attends to the whole
+        # cache plus the earlier new tokens
+        attn_mask = None
+        if past_len > 0 and T > 1:
+            attn_mask = self.causal_mask[past_len:past_len + T, :past_len + T]
+        
         # Transformer blocks
-        x = self.blocks(x)
+        for i, block in enumerate(self.blocks):
+            if self.training and self.config.grad_checkpoint:
+                x = checkpoint(block, x, use_reentrant=False)
+            else:
+                x = block(x, kv_cache, i, attn_mask)
         x = self.ln_f(x)
         logits = self.lm_head(x)
+        if logits.size(-1) > self.config.vocab_size:
+            logits[..., self.config.vocab_size:] = float('-inf')
         
         # Loss
         loss = None
@@ -132,23 +256,38 @@ class GPT(nn.Module):
     
     @torch.no_grad()
     def generate(self, idx, max_new_tokens, temperature=1.0, top_k=None):
-        """Generate text with temperature and top-k sampling"""
-        for _ in range(max_new_tokens):
-            # Crop context to block_size
-            idx_cond = idx[:, -self.config.block_size:]
-            
-            # Get predictions
-            logits, _ = self(idx_cond)
+        """
+        Generate text with temperature and top-k sampling.
+        
+        While the context fits in block_size, keys/values are cached per
+        layer: the prompt is encoded once and each step only runs the newest
+        token. Once the context overflows, it is cropped and fully re-encoded
+        every step, since every token's position shifts.
+        """
+        # Write tokens into one preallocated buffer rather than torch.cat-ing
+        # (and copying) the whole sequence on every step
+        T0 = idx.size(1)
+        out = idx.new_empty(idx.size(0), T0 + max_new_tokens)
+        out[:, :T0] = idx
+        
+        kv_cache = [None] * len(self.blocks)
+        cached_len = 0
+        for cur_len in range(T0, T0 + max_new_tokens):
+            if cur_len > self.config.block_size:
+                # Crop context to block_size
+                logits, _ = self(out[:, cur_len - self.config.block_size:cur_len])
+            else:
+                logits, _ = self(out[:, cached_len:cur_len], kv_cache=kv_cache)
+                cached_len = cur_len
             logits = logits[:, -1, :] / temperature
             
-            # Optional top-k sampling
+            # Sample, with optional top-k: draw over the k best logits only,
+            # then map the draw back to vocabulary ids
             if top_k is not None:
-                v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
-                logits[logits < v[:, [-1]]] = -float('inf')
-            
-            # Sample
-            probs = F.softmax(logits, dim=-1)
-            idx_next = torch.multinomial(probs, num_samples=1)
-            idx = torch.cat((idx, idx_next), dim=1)
+                v, ix = torch.topk(logits, min(top_k, logits.size(-1)))
+                idx_next = ix.gather(-1, _gumbel_argmax(v))
+            else:
+                idx_next = _gumbel_argmax(logits)
+            out[:, cur_len] = idx_next[:, 0]
         
-        return idx
+        return out
@@ -1,25 +1,31 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from torch.utils.data import Dataset, DataLoader
 import argparse
+import contextlib
 import os
 
 # Configuration
 class Config:
     # Model
     vocab_size = None  # Set from data
+    padded_vocab_size = None  # Embedding/lm_head rows, rounded up for tensor cores (None: vocab_size)
     n_embd = 128
     n_head = 4
     n_layer = 4
     block_size = 128
     dropout = 0.1
+    tie_weights = False  # Share token_embedding and lm_head weights (no lm_head bias)
     
     # Training
     batch_size = 64
     learning_rate = 3e-4
     max_iters = 5000
     eval_interval = 500
+    grad_checkpoint = False  # Recompute block activations in backward to save memory
     
     # System
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -32,37 +38,120 @@ class CharTokenizer:
         self.stoi = {ch: i for i, ch in enumerate(chars)}
         self.itos = {i: ch for i, ch in enumerate(chars)}
     
+    def __getstate__(self):
+        # Lookup tables are rebuilt on demand, so keep them out of checkpoints
+        state = self.__dict__.copy()
+        state.pop('_encode_lut', None)
+        state.pop('_decode_lut', None)
+        return state
+    
+    def _luts(self):
+        """
+        Code point -> token id (-1 if not in vocab) and token id -> code point
+        arrays, built on first use (older pickled tokenizers lack them).
+        """
+        if getattr(self, '_encode_lut', None) is None:
+            code_points = np.array([ord(self.itos[i]) for i in range(self.vocab_size)], dtype=np.uint32)
+            encode_lut = np.full(int(code_points.max()) + 1, -1, dtype=np.int64)
+            encode_lut[code_points] = np.arange(self.vocab_size)
+            self._encode_lut, self._decode_lut = encode_lut, code_points
+        return self._encode_lut, self._decode_lut
+    
+    def encode_array(self, s, chunk_size=1 << 20):
+        """
+        Encode to an int64 NumPy array (wrap with torch.from_numpy without copying).
+        
+        Long texts are converted chunk_size characters at a time into one
+        preallocated array, so the UTF-32 and lookup temporaries stay small
+        instead of scaling with the whole corpus.
+        """
+        encode_lut, _ = self._luts()
+        ids = np.empty(len(s), dtype=np.int64)
+        for start in range(0, len(s), chunk_size):
+            chunk = s[start:start + chunk_size]
+            code_points = np.frombuffer(chunk.encode('utf-32-le'), dtype=np.uint32)
+            chunk_ids = encode_lut[np.minimum(code_points, len(encode_lut) - 1)]
+            unknown = (chunk_ids < 0) | (code_points >= len(encode_lut))
+            if unknown.any():
+                raise KeyError(chunk[int(unknown.argmax())])
+            ids[start:start + len(chunk)] = chunk_ids
+        return ids
+    
     def encode(self, s):
-        return [self.stoi[c] for c in s]
+        return self.encode_array(s).tolist()
     
     def decode(self, l):
-        return ''.join([self.itos[i] for i in l])
+        _, decode_lut = self._luts()
+        return decode_lut[np.asarray(l, dtype=np.int64)].tobytes().decode('utf-32-le')
 
 # Dataset
 class TextDataset(Dataset):
     def __init__(self, data, block_size):
-        self.data = data
+        # One contiguous tensor up front; samples are views into it
+        self.data = torch.as_tensor(data, dtype=torch.long)
         self.block_size = block_size
     
     def __len__(self):
         return len(self.data) - self.block_size
     
     def __getitem__(self, idx):
-        x = torch.tensor(self.data[idx:idx + self.block_size], dtype=torch.long)
-        y = torch.tensor(self.data[idx + 1:idx + self.block_size + 1], dtype=torch.long)
+        x = self.data[idx:idx + self.block_size]
+        y = self.data[idx + 1:idx + self.block_size + 1]
         return x, y
 
 # Model
+class CausalSelfAttention(nn.Module):
+    """
+    Multi-head causal self-attention on F.scaled_dot_product_attention, with
+    an optional per-layer KV cache for incremental decoding.
+    
+    Parameters keep nn.MultiheadAttention's names and packed QKV layout
+    (in_proj_weight, in_proj_bias, out_proj) so existing checkpoints load.
+    """
+    def __init__(self, config):
+        super().__init__()
+        self.n_head = config.n_head
+        self.dropout = config.dropout
+        self.in_proj_weight = nn.Parameter(torch.empty(3 * config.n_embd, config.n_embd))
+        self.in_proj_bias = nn.Parameter(torch.zeros(3 * config.n_embd))
+        self.out_proj = nn.Linear(config.n_embd, config.n_embd)
+        nn.init.xavier_uniform_(self.in_proj_weight)
+    
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
+        B, T, C = x.shape
+        head_dim = C // self.n_head
+        
+        # (B, T, C) -> 3 x (B, n_head, T, head_dim)
+        q, k, v = F.linear(x, self.in_proj_weight, self.in_proj_bias).split(C, dim=2)
+        q = q.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        k = k.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        v = v.view(B, T, self.n_head, head_dim).transpose(1, 2)
+        
+        # Prepend cached keys/values of earlier positions, then cache the result
+        past = kv_cache[layer_idx] if kv_cache is not None else None
+        if past is not None:
+            k = torch.cat((past[0], k), dim=2)
+            v = torch.cat((past[1], v), dim=2)
+        if kv_cache is not None:
+            kv_cache[layer_idx] = (k, v)
+        
+        # Fused (flash / memory-efficient) kernel; never materializes T x T.
+        # Without a cache the kernel applies the causal mask itself; with
+        # one, GPT.forward passes the offset mask (None for a single token)
+        y = F.scaled_dot_product_attention(
+            q, k, v,
+            attn_mask=attn_mask,
+            dropout_p=self.dropout if self.training else 0.0,
+            is_causal=past is None and T > 1
+        )
+        y = y.transpose(1, 2).contiguous().view(B, T, C)
+        return self.out_proj(y)
+
 class TransformerBlock(nn.Module):
     def __init__(self, config):
         super().__init__()
         self.ln1 = nn.LayerNorm(config.n_embd)
-        self.attn = nn.MultiheadAttention(
-            embed_dim=config.n_embd,
-            num_heads=config.n_head,
-            dropout=config.dropout,
-            batch_first=True
-        )
+        self.attn = CausalSelfAttention(config)
         self.ln2 = nn.LayerNorm(config.n_embd)
         self.mlp = nn.Sequential(
             nn.Linear(config.n_embd, 4 * config.n_embd),
@@ -71,30 +160,48 @@ class TransformerBlock(nn.Module):
             nn.Dropout(config.dropout),
         )
     
-    def forward(self, x):
-        # Self-attention with causal mask
-        x_norm = self.ln1(x)
-        attn_out, _ = self.attn(
-            x_norm, x_norm, x_norm,
-            need_weights=False,
-            is_causal=True
-        )
-        x = x + attn_out
+    def forward(self, x, kv_cache=None, layer_idx=0, attn_mask=None):
+        # Self-attention (causal)
+        x = x + self.attn(self.ln1(x), kv_cache, layer_idx, attn_mask)
         
         # Feed-forward
         x = x + self.mlp(self.ln2(x))
         return x
 
+def _gumbel_argmax(logits):
+    """
+    Draw one index per row from softmax(logits) via the Gumbel-max trick:
+    argmax(logits + Gumbel noise) is one pointwise op and one reduction, with
+    no probability tensor or multinomial scan. Runs in FP32 so noise drawn
+    under bf16/fp16 autocast keeps full resolution.
+    """
+    logits = logits.float()
+    gumbel = -torch.log(-torch.log(torch.rand_like(logits).clamp_min(1e-9)))
+    return (logits + gumbel).argmax(dim=-1, keepdim=True)
+
 class GPT(nn.Module):
     def __init__(self, config):
         super().__init__()
         self.config = config
         
-        self.token_embedding = nn.Embedding(config.vocab_size, config.n_embd)
+        # Rows past vocab_size are padding; their logits are masked in forward
+        n_vocab = config.padded_vocab_size or config.vocab_size
+        self.token_embedding = nn.Embedding(n_vocab, config.n_embd)
         self.position_embedding = nn.Embedding(config.block_size, config.n_embd)
-        self.blocks = nn.Sequential(*[TransformerBlock(config) for _ in range(config.n_layer)])
+        self.blocks = nn.ModuleList([TransformerBlock(config) for _ in range(config.n_layer)])
         self.ln_f = nn.LayerNorm(config.n_embd)
-        self.lm_head = nn.Linear(config.n_embd, config.vocab_size)
+        self.lm_head = nn.Linear(config.n_embd, n_vocab, bias=not config.tie_weights)
+        if config.tie_weights:
+            self.lm_head.weight = self.token_embedding.weight
+        
+        # Allowed (query, key) positions and position ids, built once and
+        # sliced per call; not saved in checkpoints
+        self.register_buffer(
+            'causal_mask',
+            torch.tril(torch.ones(config.block_size, config.block_size, dtype=torch.bool)),
+            persistent=False
+        )
+        self.register_buffer('pos_ids', torch.arange(config.block_size), persistent=False)
         
         self.apply(self._init_weights)
     
@@ -103,19 +210,41 @@ class GPT(nn.Module):
             module.weight.data.normal_(mean=0.0, std=0.02)
             if isinstance(module, nn.Linear) and module.bias is not None:
                 module.bias.data.zero_()
+        elif isinstance(module, CausalSelfAttention):
+            # Packed QKV projection: same init as the other linear layers
+            module.in_proj_weight.data.normal_(mean=0.0, std=0.02)
+            module.in_proj_bias.data.zero_()
     
-    def forward(self, idx, targets=None):
+    def forward(self, idx, targets=None, kv_cache=None):
+        """
+        kv_cache: optional list with one entry per block (None when empty),
+        updated in place with each block's keys/values; idx then holds only
+        the positions after the cached ones.
+        """
         B, T = idx.shape
+        past_len = kv_cache[0][0].size(2) if kv_cache is not None and kv_cache[0] is not None else 0
         
         # Embeddings
         tok_emb = self.token_embedding(idx)
-        pos_emb = self.position_embedding(torch.arange(T, device=idx.device))
+        pos_emb = self.position_embedding(self.pos_ids[past_len:past_len + T])
         x = tok_emb + pos_emb
         
+        # Several new tokens after cached ones: each attends to the whole
+        # cache plus the earlier new tokens
+        attn_mask = None
+        if past_len > 0 and T > 1:
+            attn_mask = self.causal_mask[past_len:past_len + T, :past_len + T]
+        
         # Transformer blocks
-        x = self.blocks(x)
+        for i, block in enumerate(self.blocks):
+            if self.training and self.config.grad_checkpoint:
+                x = checkpoint(block, x, use_reentrant=False)
+            else:
+                x = block(x, kv_cache, i, attn_mask)
         x = self.ln_f(x)
         logits = self.lm_head(x)
+        if logits.size(-1) > self.config.vocab_size:
+            logits[..., self.config.vocab_size:] = float('-inf')
         
         # Loss
         loss = None
@@ -129,13 +258,24 @@ class GPT(nn.Module):
     
     @torch.no_grad()
     def generate(self, idx, max_new_tokens, temperature=1.0, top_k=None):
-        """Generate text with temperature and top-k sampling"""
+        """
+        Generate text with temperature and top-k sampling.
+        
+        While the context fits in block_size, keys/values are cached per
+        layer: the prompt is encoded once and each step only runs the newest
+        token. Once the context overflows, it is cropped and fully re-encoded
+        every step, since every token's position shifts.
+        """
+        kv_cache = [None] * len(self.blocks)
+        cached_len = 0
         for _ in range(max_new_tokens):
-            # Crop context to block_size
-            idx_cond = idx[:, -self.config.block_size:]
-            
-            # Get predictions
-            logits, _ = self(idx_cond)
+            cur_len = idx.size(1)
+            if cur_len > self.config.block_size:
+                # Crop context to block_size
+                logits, _ = self(idx[:, -self.config.block_size:])
+            else:
+                logits, _ = self(idx[:, cached_len:], kv_cache=kv_cache)
+                cached_len = cur_len
             logits = logits[:, -1, :] / temperature
             
             # Optional top-k sampling
@@ -144,14 +284,38 @@ class GPT(nn.Module):
                 logits[logits < v[:, [-1]]] = -float('inf')
             
             # Sample
-            probs = F.softmax(logits, dim=-1)
-            idx_next = torch.multinomial(probs, num_samples=1)
+            idx_next = _gumbel_argmax(logits)
             idx = torch.cat((idx, idx_next), dim=1)
         
         return idx
 
+# Mixed precision: autocast dtype per --precision choice
+PRECISION_DTYPES = {'fp32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+def _train_autocast(device, precision):
+    """Autocast context for the training forward pass (CUDA only; FP32 elsewhere)."""
+    dtype = PRECISION_DTYPES[precision]
+    if dtype is None or not str(device).startswith('cuda'):
+        return contextlib.nullcontext()
+    return torch.autocast(device_type='cuda', dtype=dtype)
+
+def _resolve_precision(precision, use_cuda):
+    """Fall back from BF16 to FP16 (with loss scaling) on GPUs without BF16 support."""
+    if precision == 'bf16' and use_cuda and not torch.cuda.is_bf16_supported():
+        print("BF16 not supported on this GPU, using FP16")
+        return 'fp16'
+    return precision
+
+def _infinite_batches(loader):
+    """Yield batches forever, starting a new (reshuffled) epoch when one ends."""
+    while True:
+        yield from loader
+
 # Training function
-def train(config, text_file):
+def train(config, text_file, precision='bf16'):
+    # Allow TF32 tensor cores for matmuls left in FP32
+    torch.set_float32_matmul_precision('high')
+    
     # Load and prepare data
     print(f"Loading {text_file}...")
     with open(text_file, 'r', encoding='utf-8') as f:
@@ -161,47 +325,69 @@ def train(config, text_file):
     # Create tokenizer
     tokenizer = CharTokenizer(text)
     config.vocab_size = tokenizer.vocab_size
+    # Round the lm_head GEMM width up to a multiple of 64 for tensor cores
+    config.padded_vocab_size = (config.vocab_size + 63) // 64 * 64
     print(f"Vocabulary size: {config.vocab_size}")
     
-    # Encode data
-    data = tokenizer.encode(text)
+    # Encode data (NumPy array; TextDataset wraps it without copying)
+    data = tokenizer.encode_array(text)
     n = int(0.9 * len(data))
     train_data = data[:n]
     val_data = data[n:]
     
     # Create datasets
     train_dataset = TextDataset(train_data, config.block_size)
-    train_loader = DataLoader(train_dataset, batch_size=config.batch_size, shuffle=True)
+    use_cuda = str(config.device).startswith('cuda')
+    precision = _resolve_precision(precision, use_cuda)
+    train_loader = DataLoader(
+        train_dataset, batch_size=config.batch_size, shuffle=True, drop_last=True,
+        pin_memory=use_cuda
+    )
     
     # Create model
     model = GPT(config).to(config.device)
-    optimizer = torch.optim.AdamW(model.parameters(), lr=config.learning_rate)
+    # One fused kernel for the whole update on GPU; multi-tensor (foreach) on CPU
+    optimizer = torch.optim.AdamW(
+        model.parameters(), lr=config.learning_rate,
+        fused=use_cuda, foreach=not use_cuda
+    )
+    
+    # Fuse pointwise ops and replay the step as CUDA graphs on GPU. Shapes are
+    # static (fixed block_size, drop_last batches); keep the uncompiled module
+    # for the checkpoint so state_dict keys stay unprefixed
+    raw_model = model
+    if use_cuda:
+        import torch._inductor.config as inductor_config
+        inductor_config.coordinate_descent_tuning = True
+        model = torch.compile(model, mode='reduce-overhead', fullgraph=True, dynamic=False)
+    
+    # Loss scaling is only needed for FP16; BF16 has FP32's exponent range
+    scaler = torch.amp.GradScaler('cuda', enabled=(precision == 'fp16' and use_cuda))
     
-    n_params = sum(p.numel() for p in model.parameters()) / 1e6
+    n_params = sum(p.numel() for p in raw_model.parameters()) / 1e6
     print(f"Model parameters: {n_params:.2f}M")
     
     # Training loop
     print("\nTraining...")
     model.train()
     
-    data_iter = iter(train_loader)
+    data_iter = _infinite_batches(train_loader)
     for iter_num in range(config.max_iters):
         # Get batch
-        try:
-            X, Y = next(data_iter)
-        except StopIteration:
-            data_iter = iter(train_loader)
-            X, Y = next(data_iter)
+        X, Y = next(data_iter)
         
-        X, Y = X.to(config.device), Y.to(config.device)
+        # Pinned batches copy asynchronously, overlapping the previous step
+        X, Y = X.to(config.device, non_blocking=True), Y.to(config.device, non_blocking=True)
         
         # Forward pass
-        logits, loss = model(X, Y)
+        with _train_autocast(config.device, precision):
+            logits, loss = model(X, Y)
         
-        # Backward pass
+        # Backward pass (optimizer state and master weights stay FP32)
         optimizer.zero_grad(set_to_none=True)
-        loss.backward()
-        optimizer.step()
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
         
         # Logging
         if iter_num % config.eval_interval == 0:
@@ -209,14 +395,14 @@ def train(config, text_file):
     
     # Save model
     checkpoint = {
-        'model_state_dict': model.state_dict(),
+        'model_state_dict': raw_model.state_dict(),
         'config': config,
         'tokenizer': tokenizer,
     }
     torch.save(checkpoint, 'model.pt')
     print(f"\nModel saved to model.pt")
     
-    return model, tokenizer
+    return raw_model, tokenizer
 
 # Inference function
 def inference(checkpoint_path, prompt="", max_new_tokens=200, temperature=0.8, top_k=50):
@@ -262,12 +448,17 @@ def main():
     parser.add_argument('--max-tokens', type=int, default=200, help='Max tokens to generate')
     parser.add_argument('--temperature', type=float, default=0.8, help='Sampling temperature')
     parser.add_argument('--top-k', type=int, default=50, help='Top-k sampling')
+    parser.add_argument('--tie-weights', action=argparse.BooleanOptionalAction, default=False, help='Share the token embedding and output projection weights (off by default, matching Config.tie_weights)')
+    parser.add_argument('--grad-checkpoint', action='store_true', help='Recompute activations in backward to fit larger batches')
+    parser.add_argument('--precision', choices=list(PRECISION_DTYPES), default='bf16', help='Mixed precision mode for CUDA training')
     
     args = parser.parse_args()
     
     if args.mode == 'train':
         config = Config()
-        train(config, args.text_file)
+        config.grad_checkpoint = args.grad_checkpoint
+        config.tie_weights = args.tie_weights
+        train(config, args.text_file, precision=args.precision)
         
         # Generate sample after training
         print("\nGenerating sample...")
@@ -1,6 +1,7 @@
 import torch
 from torch.utils.data import DataLoader
 import argparse
+import contextlib
 import os
 import glob
 from model import Config, CharTokenizer, TextDataset, GPT
@@ -45,8 +46,33 @@ def load_text_from_file(text_file, data_folder='../data'):
     
     return text
 
+# Mixed precision: autocast dtype per --precision choice
+PRECISION_DTYPES = {'fp32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+def _train_autocast(device, precision):
+    """Autocast context for the training forward pass (CUDA only; FP32 elsewhere)."""
+    dtype = PRECISION_DTYPES[precision]
+    if dtype is None or not str(device).startswith('cuda'):
+        return contextlib.nullcontext()
+    return torch.autocast(device_type='cuda', dtype=dtype)
+
+def _resolve_precision(precision, use_cuda):
+    """Fall back from BF16 to FP16 (with loss scaling) on GPUs without BF16 support."""
+    if precision == 'bf16' and use_cuda and not torch.cuda.is_bf16_supported():
+        print("BF16 not supported on this GPU, using FP16")
+        return 'fp16'
+    return precision
+
+def _infinite_batches(loader):
+    """Yield batches forever, starting a new (reshuffled) epoch when one ends."""
+    while True:
+        yield from loader
+
 # Training function
-def train(config, data_folder='../data', output_path='model.pt', text_file=None):
+def train(config, data_folder='../data', output_path='model.pt', text_file=None, precision='bf16'):
+    # Allow TF32 tensor cores for matmuls left in FP32
+    torch.set_float32_matmul_precision('high')
+    
     # Ensure models directory exists
     models_dir = os.path.join(os.path.dirname(__file__), 'models')
     os.makedirs(models_dir, exist_ok=True)
@@ -70,10 +96,12 @@ def train(config, data_folder='../data', output_path='model.pt', text_file=None)
     # Create tokenizer
     tokenizer = CharTokenizer(text)
     config.vocab_size = tokenizer.vocab_size
+    # Round the lm_head GEMM width up to a multiple of 64 for tensor cores
+    config.padded_vocab_size = (config.vocab_size + 63) // 64 * 64
     print(f"Vocabulary size: {config.vocab_size}")
     
-    # Encode data
-    data = tokenizer.encode(text)
+    # Encode data (NumPy array; TextDataset wraps it without copying)
+    data = tokenizer.encode_array(text)
     n = int(0.9 * len(data))
     train_data = data[:n]
     val_data = data[n:]
@@ -82,37 +110,57 @@ def train(config, data_folder='../data', output_path='model.pt', text_file=None)
     
     # Create datasets
     train_dataset = TextDataset(train_data, config.block_size)
-    train_loader = DataLoader(train_dataset, batch_size=config.batch_size, shuffle=True)
+    use_cuda = str(config.device).startswith('cuda')
+    precision = _resolve_precision(precision, use_cuda)
+    train_loader = DataLoader(
+        train_dataset, batch_size=config.batch_size, shuffle=True, drop_last=True,
+        pin_memory=use_cuda
+    )
     
     # Create model
     model = GPT(config).to(config.device)
-    optimizer = torch.optim.AdamW(model.parameters(), lr=config.learning_rate)
-    
-    n_params = sum(p.numel() for p in model.parameters()) / 1e6
+    # One fused kernel for the whole update on GPU; multi-tensor (foreach) on CPU
+    optimizer = torch.optim.AdamW(
+        model.parameters(), lr=config.learning_rate,
+        fused=use_cuda, foreach=not use_cuda
+    )
+    
+    # Fuse pointwise ops and replay the step as CUDA graphs on GPU. Shapes are
+    # static (fixed block_size, drop_last batches); keep the uncompiled module
+    # for the checkpoint so state_dict keys stay unprefixed
+    raw_model = model
+    if use_cuda:
+        import torch._inductor.config as inductor_config
+        inductor_config.coordinate_descent_tuning = True
+        model = torch.compile(model, mode='reduce-overhead', fullgraph=True, dynamic=False)
+    
+    # Loss scaling is only needed for FP16; BF16 has FP32's exponent range
+    scaler = torch.amp.GradScaler('cuda', enabled=(precision == 'fp16' and use_cuda))
+    
+    n_params = sum(p.numel() for p in raw_model.parameters()) / 1e6
     print(f"Model parameters: {n_params:.2f}M")
     
     # Training loop
     print("\nTraining...")
     model.train()
     
-    data_iter = iter(train_loader)
+    data_iter = _infinite_batches(train_loader)
     for iter_num in range(config.max_iters):
         # Get batch
-        try:
-            X, Y = next(data_iter)
-        except StopIteration:
-            data_iter = iter(train_loader)
-            X, Y = next(data_iter)
+        X, Y = next(data_iter)
         
-        X, Y = X.to(config.device), Y.to(config.device)
+        # Pinned batches copy asynchronously, overlapping the previous step
+        X, Y = X.to(config.device, non_blocking=True), Y.to(config.device, non_blocking=True)
         
         # Forward pass
-        logits, loss = model(X, Y)
+        with _train_autocast(config.device, precision):
+            logits, loss = model(X, Y)
         
-        # Backward pass
+        # Backward pass (optimizer state and master weights stay FP32)
         optimizer.zero_grad(set_to_none=True)
-        loss.backward()
-        optimizer.step()
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
         
         # Logging
         if iter_num % config.eval_interval == 0:
@@ -120,14 +168,14 @@ def train(config, data_folder='../data', output_path='model.pt', text_file=None)
     
     # Save model
     checkpoint = {
-        'model_state_dict': model.state_dict(),
+        'model_state_dict': raw_model.state_dict(),
         'config': config,
         'tokenizer': tokenizer,
     }
     torch.save(checkpoint, output_path)
     print(f"\nModel saved to {output_path}")
     
-    return model, tokenizer, output_path
+    return raw_model, tokenizer, output_path
 
 # Main
 def main():
@@ -138,6 +186,9 @@ def main():
     parser.add_argument('--max-iters', type=int, default=5000, help='Maximum training iterations')
     parser.add_argument('--batch-size', type=int, default=64, help='Batch size')
     parser.add_argument('--learning-rate', type=float, default=3e-4, help='Learning rate')
+    parser.add_argument('--tie-weights', action=argparse.BooleanOptionalAction, default=False, help='Share the token embedding and output projection weights (off by default, matching Config.tie_weights)')
+    parser.add_argument('--grad-checkpoint', action='store_true', help='Recompute activations in backward to fit larger batches')
+    parser.add_argument('--precision', choices=list(PRECISION_DTYPES), default='bf16', help='Mixed precision mode for CUDA training')
     
     args = parser.parse_args()
     
@@ -145,8 +196,10 @@ def main():
     config.max_iters = args.max_iters
     config.batch_size = args.batch_size
     config.learning_rate = args.learning_rate
+    config.grad_checkpoint = args.grad_checkpoint
+    config.tie_weights = args.tie_weights
     
-    _, _, saved_path = train(config, data_folder=args.data_folder, output_path=args.output, text_file=args.text_file)
+    _, _, saved_path = train(config, data_folder=args.data_folder, output_path=args.output, text_file=args.text_file, precision=args.precision)
     
     # Generate sample after training
     print("\nGenerating sample...")
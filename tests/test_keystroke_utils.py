@@ -0,0 +1,42 @@
+"""Tests for keystroke_utils.py."""
+
+import unittest
+
+from keystroke_utils import iter_format_keystroke_rows, reconstruct_text
+
+
+class ReconstructTextTest(unittest.TestCase):
+    def test_named_keys(self):
+        keys = ['h', 'i', 'x', 'Backspace', 'space', 'shift', 'y', 'enter', 'unknown_key']
+        self.assertEqual(reconstruct_text(keys), 'hi y\n')
+
+
+class IterFormatKeystrokeRowsTest(unittest.TestCase):
+    def test_groups_by_app(self):
+        rows = [
+            ('2026-01-08 10:00:00', 'l', 'Terminal'),
+            ('2026-01-08 10:00:01', 's', 'Terminal'),
+            ('2026-01-08 10:00:05', 'shift', 'Safari'),
+            ('2026-01-08 10:00:09', 'q', 'Terminal'),
+        ]
+        self.assertEqual(''.join(iter_format_keystroke_rows(rows)), (
+            '8 Jan 2026 at 10:00 AM\n[Terminal]\nls\n'
+            '\n8 Jan 2026 at 10:00 AM\n[Safari]\n(App switch activity)\n'
+            '\n8 Jan 2026 at 10:00 AM\n[Terminal]\nq\n'
+        ))
+
+    def test_keys_without_app_carry_into_next_group(self):
+        rows = [
+            ('2026-01-08 10:00:00', 'a', None),
+            ('2026-01-08 10:00:01', 'b', 'Notes'),
+            ('2026-01-08 10:00:02', 'c', None),
+        ]
+        self.assertEqual(''.join(iter_format_keystroke_rows(rows)),
+                         '8 Jan 2026 at 10:00 AM\n[Notes]\nab\n')
+
+    def test_empty(self):
+        self.assertEqual(list(iter_format_keystroke_rows([])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests for llm_cache.py."""
+
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import db_utils
+import llm_cache
+import llm_utils
+from config import DB_TABLE_LLM_CACHE, LLM_CACHE_MAX_AGE_DAYS
+
+
+class LLMCacheTest(unittest.TestCase):
+    def setUp(self):
+        path = Path(tempfile.mkdtemp()) / "activity.db"
+        patcher = mock.patch.object(db_utils, 'DATABASE_PATH', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = path
+
+    def test_init_database_prunes_old_entries(self):
+        db_utils.init_database()
+        now = datetime.now()
+        with sqlite3.connect(str(self.path)) as conn:
+            conn.executemany(
+                f'INSERT INTO {DB_TABLE_LLM_CACHE} (key, response, created_at) VALUES (?, ?, ?)',
+                [('old', 'a', (now - timedelta(days=LLM_CACHE_MAX_AGE_DAYS + 1)).isoformat(' ')),
+                 ('new', 'b', (now - timedelta(days=1)).isoformat(' '))]
+            )
+
+        db_utils.init_database()
+
+        with sqlite3.connect(str(self.path)) as conn:
+            keys = [row[0] for row in conn.execute(f'SELECT key FROM {DB_TABLE_LLM_CACHE}')]
+        self.assertEqual(keys, ['new'])
+
+    def test_first_use_only_creates_cache_table(self):
+        with mock.patch.object(llm_cache, '_table_ready', False):
+            llm_cache.set_cached_response('k', 'v')
+            self.assertEqual(llm_cache.get_cached_response('k'), 'v')
+
+        with sqlite3.connect(str(self.path)) as conn:
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            created_at = conn.execute(f'SELECT created_at FROM {DB_TABLE_LLM_CACHE}').fetchone()[0]
+        self.assertEqual(tables, [DB_TABLE_LLM_CACHE])
+        self.assertIsInstance(created_at, str)
+        datetime.fromisoformat(created_at)
+
+    def test_call_llm_async_uses_cache(self):
+        completion = mock.Mock()
+        completion.choices = [mock.Mock()]
+        completion.choices[0].message.content = ' response '
+        started = []
+        both_started = asyncio.Event()
+
+        async def create(**params):
+            # Hold each request until both are in flight, so neither can be
+            # answered from a cache entry the other has already written
+            started.append(params)
+            if len(started) == 2:
+                both_started.set()
+            await both_started.wait()
+            return completion
+
+        client = mock.Mock()
+        client.chat.completions.create = mock.AsyncMock(side_effect=create)
+
+        async def run():
+            return await asyncio.gather(
+                llm_utils.call_llm_async("prompt"), llm_utils.call_llm_async("prompt")
+            )
+
+        with mock.patch.object(llm_utils, 'LLM_CACHE_ENABLED', True), \
+                mock.patch.object(llm_utils, 'get_async_groq_client', return_value=client), \
+                mock.patch.object(llm_cache, '_table_ready', False):
+            self.assertEqual(asyncio.run(run()), ['response', 'response'])
+            self.assertEqual(asyncio.run(llm_utils.call_llm_async("prompt")), 'response')
+
+        # Both concurrent misses hit the model; the later call is served from the cache
+        self.assertEqual(client.chat.completions.create.await_count, 2)
+
+    def test_close_async_groq_client(self):
+        async def run():
+            client = llm_utils.get_async_groq_client()
+            self.assertIs(llm_utils.get_async_groq_client(), client)
+            with mock.patch.object(client, 'close', mock.AsyncMock()) as close:
+                await llm_utils.close_async_groq_client()
+            close.assert_awaited_once()
+            # The next request on this loop gets a fresh client
+            self.assertIsNot(llm_utils.get_async_groq_client(), client)
+            await llm_utils.close_async_groq_client()
+
+        with mock.patch.dict('os.environ', {'GROQ_API_KEY': 'test'}):
+            asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests for llm_refiner.py."""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import llm_refiner
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class _FailingStream:
+    """Stream context manager that yields deltas, then raises."""
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        for text in self.deltas:
+            yield _chunk(text)
+        raise RuntimeError("connection reset")
+
+
+class RefineTextStreamTest(unittest.TestCase):
+    def _run(self, deltas):
+        client = mock.Mock()
+        client.chat.completions.create.return_value = _FailingStream(deltas)
+        with mock.patch.object(llm_refiner, 'get_groq_client', return_value=client), \
+                mock.patch.object(llm_refiner, 'LLM_CACHE_ENABLED', True), \
+                mock.patch.object(llm_refiner, 'get_cached_response', return_value=None), \
+                mock.patch.object(llm_refiner, 'set_cached_response') as set_cached, \
+                mock.patch('builtins.print'):
+            output = list(llm_refiner.refine_text_stream("raw log"))
+        return output, set_cached
+
+    def test_failure_before_output_falls_back_to_raw_text(self):
+        output, set_cached = self._run([])
+        self.assertEqual(output, ["[Refinement failed: connection reset]\n\nraw log"])
+        set_cached.assert_not_called()
+
+    def test_failure_after_output_marks_truncation(self):
+        output, set_cached = self._run(["Refined ", "text"])
+        self.assertEqual(output[:2], ["Refined ", "text"])
+        self.assertEqual(output[2:], ["\n\n[Refinement interrupted: connection reset]"])
+        self.assertNotIn("raw log", ''.join(output))
+        set_cached.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
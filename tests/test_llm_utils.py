@@ -0,0 +1,55 @@
+"""Tests for llm_utils.py."""
+
+import asyncio
+import unittest
+from unittest import mock
+
+import llm_utils
+
+
+def _stream(*deltas):
+    """Fake AsyncGroq stream yielding the given content deltas."""
+    chunks = []
+    for delta in deltas:
+        chunk = mock.Mock()
+        chunk.choices = [mock.Mock()]
+        chunk.choices[0].delta.content = delta
+        chunks.append(chunk)
+
+    class Stream:
+        closed = False
+
+        def __aiter__(self):
+            return self._iter()
+
+        async def _iter(self):
+            for chunk in chunks:
+                yield chunk
+
+        async def close(self):
+            self.closed = True
+
+    return Stream()
+
+
+class StreamUntilJsonEndTest(unittest.TestCase):
+    def _read(self, *deltas):
+        client = mock.Mock()
+        client.chat.completions.create = mock.AsyncMock(return_value=_stream(*deltas))
+        return asyncio.run(llm_utils._stream_until_json_end(client))
+
+    def test_stops_after_leading_json(self):
+        self.assertEqual(self._read('  ["a", "b]"', ']\nand some', ' trailing text'),
+                         '  ["a", "b]"]\nand some')
+
+    def test_stops_after_fenced_json(self):
+        self.assertEqual(self._read('``', '`json\n{"a": ', '[1]}', '\n```'),
+                         '```json\n{"a": [1]}')
+
+    def test_reads_prose_with_brackets_to_the_end(self):
+        deltas = ('Here are the [main] concepts:', ' ["a", "b"]')
+        self.assertEqual(self._read(*deltas), ''.join(deltas))
+
+
+if __name__ == '__main__':
+    unittest.main()
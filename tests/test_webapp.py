@@ -0,0 +1,87 @@
+"""Tests for webapp.py."""
+
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import config
+
+# webapp initializes the database on import; keep it out of the project root
+config.DATABASE_PATH = Path(tempfile.mkdtemp()) / "activity.db"
+
+import db_utils  # noqa: E402
+
+db_utils.DATABASE_PATH = config.DATABASE_PATH
+
+import webapp  # noqa: E402
+
+
+@unittest.skipIf(webapp.orjson is None, "orjson not installed")
+class OrjsonProviderTest(unittest.TestCase):
+    def test_jsonify_uses_orjson(self):
+        payload = {'data': [{'hour': 1, 'keystrokes': 2}], 'max_keystrokes': 2}
+        with mock.patch.object(webapp.orjson, 'dumps', wraps=webapp.orjson.dumps) as dumps:
+            with webapp.app.test_request_context():
+                body = webapp.jsonify(payload).get_data(as_text=True)
+        dumps.assert_called_once()
+        self.assertEqual(body, '{"data":[{"hour":1,"keystrokes":2}],"max_keystrokes":2}\n')
+
+    def test_indent_maps_to_orjson(self):
+        with mock.patch.object(webapp.orjson, 'dumps', wraps=webapp.orjson.dumps) as dumps:
+            text = webapp.app.json.dumps({'a': [1]}, indent=2)
+        dumps.assert_called_once()
+        self.assertEqual(text, '{\n  "a": [\n    1\n  ]\n}')
+
+    def test_unsupported_options_use_stdlib(self):
+        with mock.patch.object(webapp.orjson, 'dumps', wraps=webapp.orjson.dumps) as dumps:
+            text = webapp.app.json.dumps({'a': 'é'}, separators=(',', ':'), ensure_ascii=True)
+        dumps.assert_not_called()
+        self.assertEqual(text, '{"a":"\\u00e9"}')
+
+    def test_generate_activity_graph_uses_orjson(self):
+        tmp = Path(tempfile.mkdtemp())
+        refined = tmp / "refined.txt"
+        refined.write_text("refined")
+        tree = {'nodes': [{'id': 1, 'label': 'Coding'}]}
+
+        async def build(path):
+            return ['node']
+
+        with mock.patch.object(webapp, 'get_refined_text_path', return_value=refined), \
+                mock.patch.object(webapp, 'get_activity_tree_path', return_value=tmp / "tree.json"), \
+                mock.patch.object(webapp, 'build_activity_tree', build), \
+                mock.patch.object(webapp, 'tree_to_dict', return_value=tree), \
+                mock.patch.object(webapp.orjson, 'dumps', wraps=webapp.orjson.dumps) as dumps:
+            response = webapp.app.test_client().post(
+                '/api/generate-activity-graph', json={'date': '2024-01-02'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(),
+                         {'success': True, 'tree': tree, 'filename': 'tree.json'})
+        self.assertIn(mock.call({'success': True, 'tree': tree, 'filename': 'tree.json'},
+                                default=mock.ANY, option=mock.ANY), dumps.call_args_list)
+
+
+
+class WeeklyActivityTest(unittest.TestCase):
+    def _get(self, accept_encoding):
+        webapp._weekly_cache = None
+        return webapp.app.test_client().get(
+            '/api/weekly-activity', headers={'Accept-Encoding': accept_encoding})
+
+    def test_gzip_when_accepted(self):
+        response = self._get('gzip, deflate')
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('data', json.loads(gzip.decompress(response.get_data())))
+
+    def test_no_gzip_when_refused(self):
+        response = self._get('gzip;q=0, identity')
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        self.assertIn('data', response.get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
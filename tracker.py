@@ -4,11 +4,13 @@ from pynput import keyboard, mouse
 import threading
 import subprocess
 import re
+from collections import Counter
 from config import (
     DATABASE_PATH,
     DB_TABLE_ACTIVITY_LOG,
     DB_TABLE_KEYSTROKE_LOG,
-    ACTIVITY_SAVE_INTERVAL_SECONDS
+    ACTIVITY_SAVE_INTERVAL_SECONDS,
+    ACTIVE_APP_POLL_INTERVAL_SECONDS
 )
 from db_utils import get_thread_local_connection, init_database
 
@@ -18,7 +20,16 @@ class ActivityTracker:
         self.mouse_clicks = 0
         self.current_app = ""
         self.last_save = time.time()
-        self.keystroke_buffer = []  # Buffer to store individual keystrokes
+        # (timestamp, key, app) tuples since the last save, plus running per-app
+        # counts; the lock keeps the two in step between the listener and save threads
+        self.keystroke_buffer = []
+        self.app_keystrokes = Counter()
+        self._buffer_lock = threading.Lock()
+        
+        # Frontmost app, refreshed by a poller thread so key presses never
+        # wait on osascript
+        self._app_cache = "Unknown"
+        self._app_cache_lock = threading.Lock()
 
         # Initialize database and get thread-local connection
         self.conn = get_thread_local_connection()
@@ -28,6 +39,11 @@ class ActivityTracker:
         self.start_tracking()
     
     def get_active_app(self):
+        """Return the most recently polled frontmost app."""
+        with self._app_cache_lock:
+            return self._app_cache
+    
+    def _query_active_app(self):
         try:
             # Get active window using AppleScript
             script = '''
@@ -41,6 +57,13 @@ class ActivityTracker:
         except:
             return "Unknown"
     
+    def _poll_active_app(self):
+        while True:
+            app = self._query_active_app()
+            with self._app_cache_lock:
+                self._app_cache = app
+            time.sleep(ACTIVE_APP_POLL_INTERVAL_SECONDS)
+    
     def on_key_press(self, key):
         self.keystroke_count += 1
         
@@ -52,11 +75,9 @@ class ActivityTracker:
         
         # Add to buffer with timestamp and current app
         current_app = self.get_active_app()
-        self.keystroke_buffer.append({
-            'timestamp': datetime.now(),
-            'key': key_str,
-            'app': current_app
-        })
+        with self._buffer_lock:
+            self.keystroke_buffer.append((datetime.now(), key_str, current_app))
+            self.app_keystrokes[current_app] += 1
     
     def on_click(self, x, y, button, pressed):
         if pressed:
@@ -69,18 +90,17 @@ class ActivityTracker:
             current_hour = datetime.now().hour
             
             if self.keystroke_count > 0 or self.mouse_clicks > 0:
-                # Aggregate keystrokes by app from the buffer
-                app_keystrokes = {}
-                for keystroke in self.keystroke_buffer:
-                    app = keystroke['app']
-                    app_keystrokes[app] = app_keystrokes.get(app, 0) + 1
+                # Take the buffer and per-app counts; keys pressed while
+                # saving go into fresh ones
+                with self._buffer_lock:
+                    keystrokes, self.keystroke_buffer = self.keystroke_buffer, []
+                    app_keystrokes, self.app_keystrokes = self.app_keystrokes, Counter()
                 
-                # Save individual keystrokes from buffer
-                for keystroke in self.keystroke_buffer:
-                    self.cursor.execute(f'''
-                        INSERT INTO {DB_TABLE_KEYSTROKE_LOG} (timestamp, key_pressed, app_name)
-                        VALUES (?, ?, ?)
-                    ''', (keystroke['timestamp'], keystroke['key'], keystroke['app']))
+                # Save individual keystrokes from buffer in one bulk insert
+                self.cursor.executemany(f'''
+                    INSERT INTO {DB_TABLE_KEYSTROKE_LOG} (timestamp, key_pressed, app_name)
+                    VALUES (?, ?, ?)
+                ''', keystrokes)
                 
                 # Distribute clicks to the app with most keystrokes (best approximation)
                 # or to current app if no keystrokes
@@ -89,15 +109,17 @@ class ActivityTracker:
                 else:
                     main_app = self.get_active_app()
                 
-                # Save activity_log entries for each app
-                for app, key_count in app_keystrokes.items():
-                    # Give clicks to the main app only
-                    clicks = self.mouse_clicks if app == main_app else 0
-                    self.cursor.execute(f'''
-                        INSERT INTO {DB_TABLE_ACTIVITY_LOG}
-                        (timestamp, hour, app_name, keystrokes, clicks)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (datetime.now(), current_hour, app, key_count, clicks))
+                # Save activity_log entries for each app (clicks go to the main app only)
+                saved_at = datetime.now()
+                self.cursor.executemany(f'''
+                    INSERT INTO {DB_TABLE_ACTIVITY_LOG}
+                    (timestamp, hour, app_name, keystrokes, clicks)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (saved_at, current_hour, app, key_count,
+                     self.mouse_clicks if app == main_app else 0)
+                    for app, key_count in app_keystrokes.items()
+                ])
 
                 # If there were clicks but no keystrokes, still log the clicks
                 if not app_keystrokes and self.mouse_clicks > 0:
@@ -108,16 +130,22 @@ class ActivityTracker:
                         VALUES (?, ?, ?, ?, ?)
                     ''', (datetime.now(), current_hour, current_app, 0, self.mouse_clicks))
                 
+                # All inserts above share one implicit transaction
                 self.conn.commit()
                 
-                print(f"Logged: {app_keystrokes} keys, {self.mouse_clicks} clicks")
+                print(f"Logged: {dict(app_keystrokes)} keys, {self.mouse_clicks} clicks")
                 
-                # Reset counters and buffer
+                # Reset counters
                 self.keystroke_count = 0
                 self.mouse_clicks = 0
-                self.keystroke_buffer = []
     
     def start_tracking(self):
+        # Start active-app poller (first query inline so early keys are attributed)
+        self._app_cache = self._query_active_app()
+        app_thread = threading.Thread(target=self._poll_active_app)
+        app_thread.daemon = True
+        app_thread.start()
+        
         # Start keyboard listener
         keyboard_listener = keyboard.Listener(on_press=self.on_key_press)
         keyboard_listener.start()
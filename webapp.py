@@ -1,117 +1,220 @@
-from flask import Flask, render_template, request, Response, jsonify
+from flask import Flask, render_template, request, Response, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, date, timedelta
-import json
+import functools
+import gzip
+import hashlib
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from llm_refiner import refine_text
+try:
+    import orjson
+except ImportError:  # optional accelerator; fall back to Flask's stdlib JSON provider
+    orjson = None
+
+from llm_refiner import refine_text, refine_text_stream
 from activity_network import build_activity_tree, tree_to_dict
 from config import (
     DATABASE_PATH,
     KEYSTROKE_LIMIT_DASHBOARD,
+    WEEKLY_ACTIVITY_CACHE_SECONDS,
     FLASK_HOST,
     FLASK_PORT,
     FLASK_DEBUG,
     DB_TABLE_ACTIVITY_LOG,
     DB_TABLE_KEYSTROKE_LOG
 )
-from db_utils import get_db_connection
-from date_utils import parse_date_param, format_date_filename
-from keystroke_utils import group_keystrokes_by_app, format_keystroke_groups
+from db_utils import get_db_connection, init_database
+from date_utils import parse_date_param, format_date_filename, day_bounds
+from keystroke_utils import iter_format_keystroke_rows
 from file_utils import (
     ensure_data_directory,
     get_refined_text_path,
     get_activity_tree_path,
     get_keystroke_export_filename,
-    read_text_file,
     write_text_file,
-    read_json_file,
     write_json_file
 )
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson; other behaviour is inherited."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        # response() (and so jsonify) always passes compact separators or
+        # indent=2; orjson's output is compact by default and OPT_INDENT_2
+        # covers the debug case. Any other json.dumps option stays on the
+        # stdlib path
+        unsupported = dict(kwargs)
+        if unsupported.get('separators') == (',', ':'):
+            del unsupported['separators']
+        if unsupported.get('indent') == 2:
+            del unsupported['indent']
+            option |= orjson.OPT_INDENT_2
+        if unsupported:
+            return super().dumps(obj, **kwargs)
+
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+# Chart x-axis labels are the same on every dashboard; encode them once
+_HOURS_JSON = app.json.dumps(list(range(24)))
+
+# Make sure tables and the indexes the dashboard queries rely on exist, even
+# if the tracker has not been restarted since they were added
+init_database()
+
+def _summarize_activity(rows):
+    """
+    Derive the dashboard aggregates from per-(hour, app) activity rows,
+    given as (hour, app_name, keystrokes, clicks, minutes_active) tuples.
+
+    Returns:
+        Tuple of (keystrokes by hour, clicks by hour - both 24-entry lists
+        ready for the charts, top 10 apps by minutes active, day totals,
+        most productive hour or None)
+    """
+    keystrokes_by_hour = [0] * 24
+    clicks_by_hour = [0] * 24
+    active_hours = set()
+    apps = {}
+    for hour, app_name, keystrokes, clicks, minutes_active in rows:
+        keystrokes = keystrokes or 0
+        clicks = clicks or 0
+
+        keystrokes_by_hour[hour] += keystrokes
+        clicks_by_hour[hour] += clicks
+        active_hours.add(hour)
+
+        app = apps.setdefault(app_name, {
+            'app_name': app_name, 'total_keystrokes': 0, 'total_clicks': 0, 'minutes_active': 0
+        })
+        app['total_keystrokes'] += keystrokes
+        app['total_clicks'] += clicks
+        app['minutes_active'] += minutes_active
+
+    # Ties go to the later app name / hour, as the previous ORDER BY ... LIMIT queries did
+    app_usage = sorted(
+        apps.values(), key=lambda app: (app['minutes_active'], app['app_name'] or ''), reverse=True
+    )[:10]
+
+    total_activity = {
+        'total_keystrokes': sum(keystrokes_by_hour) if active_hours else None,
+        'total_clicks': sum(clicks_by_hour) if active_hours else None,
+        'active_hours': len(active_hours),
+        'first_active_hour': min(active_hours) if active_hours else None,
+        'last_active_hour': max(active_hours) if active_hours else None,
+    }
+
+    most_productive = None
+    if active_hours:
+        best_hour = max(
+            active_hours, key=lambda hour: (keystrokes_by_hour[hour] + clicks_by_hour[hour], hour)
+        )
+        most_productive = {
+            'hour': best_hour,
+            'total_activity': keystrokes_by_hour[best_hour] + clicks_by_hour[best_hour],
+        }
+
+    return keystrokes_by_hour, clicks_by_hour, app_usage, total_activity, most_productive
+
+def _day_version(selected_date: date) -> tuple:
+    """
+    Cheap fingerprint of a day's data: activity row count and latest keystroke.
+
+    Rows are only ever appended, so the fingerprint changes whenever the
+    tracker saves into the day - each minute for today, and once more for
+    a past day when the last keystrokes before midnight are flushed just
+    after it. Both are answered from the timestamp indexes.
+    """
+    day_start, day_end = day_bounds(selected_date)
+    with get_db_connection(row_factory=False) as conn:
+        return conn.execute(f'''
+            SELECT
+                (SELECT COUNT(*) FROM {DB_TABLE_ACTIVITY_LOG}
+                 WHERE timestamp >= ? AND timestamp < ?),
+                (SELECT MAX(timestamp) FROM {DB_TABLE_KEYSTROKE_LOG}
+                 WHERE timestamp >= ? AND timestamp < ?)
+        ''', (day_start, day_end, day_start, day_end)).fetchone()
+
+
+@functools.lru_cache(maxsize=64)
+def _render_dashboard_cached(selected_date: date, today: date, version: tuple) -> str:
+    """Rendered dashboard; version (see _day_version) keys out stale pages."""
+    return _render_dashboard(selected_date, today)
+
 
 @app.route('/')
 def dashboard():
+    # Get date from query parameter, default to today
+    selected_date = parse_date_param(request.args.get('date'))
+    today = date.today()
+
+    # Serve the cached page while the day's data is unchanged (past dates,
+    # or today between tracker saves), or a 304 if the browser has it
+    version = _day_version(selected_date)
+    etag = hashlib.sha1(f'{selected_date}|{today}|{version}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = app.make_response(_render_dashboard_cached(selected_date, today, version))
+    response.set_etag(etag)
+    return response
+
+
+def _render_dashboard(selected_date: date, today: date) -> str:
+    """Query the day's activity and render the dashboard template."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-
-        # Get date from query parameter, default to today
-        selected_date = parse_date_param(request.args.get('date'))
-        today = date.today()
+        day_start, day_end = day_bounds(selected_date)
     
-        # Get hourly activity for selected date
-        hourly_data = cursor.execute(f'''
-            SELECT hour, SUM(keystrokes) as total_keystrokes, SUM(clicks) as total_clicks
-            FROM {DB_TABLE_ACTIVITY_LOG}
-            WHERE DATE(timestamp) = ?
-            GROUP BY hour
-            ORDER BY hour
-        ''', (selected_date.isoformat(),)).fetchall()
-
-        # Get app usage for selected date
-        app_usage = cursor.execute(f'''
-            SELECT app_name,
+        # One pass over the day's activity, grouped by (hour, app); hourly
+        # totals, app usage and the summary metrics are derived from it below.
+        # Rows come back as plain tuples for _summarize_activity to unpack
+        activity_cursor = conn.cursor()
+        activity_cursor.row_factory = None
+        activity_rows = activity_cursor.execute(f'''
+            SELECT hour, app_name,
                    SUM(keystrokes) as total_keystrokes,
                    SUM(clicks) as total_clicks,
                    COUNT(*) as minutes_active
             FROM {DB_TABLE_ACTIVITY_LOG}
-            WHERE DATE(timestamp) = ?
-            GROUP BY app_name
-            ORDER BY minutes_active DESC
-            LIMIT 10
-        ''', (selected_date.isoformat(),)).fetchall()
-
-        # Get productivity metrics
-        total_activity = cursor.execute(f'''
-            SELECT
-                SUM(keystrokes) as total_keystrokes,
-                SUM(clicks) as total_clicks,
-                COUNT(DISTINCT hour) as active_hours,
-                MIN(hour) as first_active_hour,
-                MAX(hour) as last_active_hour
-            FROM {DB_TABLE_ACTIVITY_LOG}
-            WHERE DATE(timestamp) = ?
-        ''', (selected_date.isoformat(),)).fetchone()
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY hour, app_name
+        ''', (day_start, day_end)).fetchall()
 
-        # Find most productive hour
-        most_productive = cursor.execute(f'''
-            SELECT hour, SUM(keystrokes) + SUM(clicks) as total_activity
-            FROM {DB_TABLE_ACTIVITY_LOG}
-            WHERE DATE(timestamp) = ?
-            GROUP BY hour
-            ORDER BY total_activity DESC
-            LIMIT 1
-        ''', (selected_date.isoformat(),)).fetchone()
-
-        # Get recent keystrokes (limit from config) - fetch newest first, then reverse for display
+        # Get recent keystrokes (limit from config): the newest ones, returned
+        # oldest to newest for stream readability
         recent_keystrokes = cursor.execute(f'''
-            SELECT timestamp, key_pressed, app_name
-            FROM {DB_TABLE_KEYSTROKE_LOG}
-            WHERE DATE(timestamp) = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (selected_date.isoformat(), KEYSTROKE_LIMIT_DASHBOARD)).fetchall()
-        # Reverse to display in chronological order (oldest to newest for stream readability)
-        recent_keystrokes = list(reversed(recent_keystrokes))
-    
-    # Prepare data for charts
-    hours = list(range(24))
-    keystrokes_by_hour = [0] * 24
-    clicks_by_hour = [0] * 24
-    
-    for row in hourly_data:
-        keystrokes_by_hour[row['hour']] = row['total_keystrokes']
-        clicks_by_hour[row['hour']] = row['total_clicks']
+            SELECT timestamp, key_pressed, app_name FROM (
+                SELECT timestamp, key_pressed, app_name
+                FROM {DB_TABLE_KEYSTROKE_LOG}
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            )
+            ORDER BY timestamp ASC
+        ''', (day_start, day_end, KEYSTROKE_LIMIT_DASHBOARD)).fetchall()
     
+    (keystrokes_by_hour, clicks_by_hour, app_usage,
+     total_activity, most_productive) = _summarize_activity(activity_rows)
+
     return render_template('dashboard.html',
-                         hourly_keystrokes=json.dumps(keystrokes_by_hour),
+                         hourly_keystrokes=app.json.dumps(keystrokes_by_hour),
                          hourly_keystrokes_list=keystrokes_by_hour,
-                         hourly_clicks=json.dumps(clicks_by_hour),
-                         hours=json.dumps(hours),
+                         hourly_clicks=app.json.dumps(clicks_by_hour),
+                         hours=_HOURS_JSON,
                          app_usage=app_usage,
                          total_activity=total_activity,
                          most_productive=most_productive,
@@ -120,6 +223,30 @@ def dashboard():
                          today=today,
                          is_today=(selected_date == today))
 
+def _has_keystrokes(bounds: tuple) -> bool:
+    """Whether any keystroke falls in the day_bounds() range (one index probe)."""
+    with get_db_connection() as conn:
+        return conn.execute(f'''
+            SELECT 1 FROM {DB_TABLE_KEYSTROKE_LOG}
+            WHERE timestamp >= ? AND timestamp < ?
+            LIMIT 1
+        ''', bounds).fetchone() is not None
+
+
+def _iter_day_keystrokes(bounds: tuple):
+    """
+    Yield (timestamp, key_pressed, app_name) tuples in the day_bounds()
+    range in time order, reading them from SQLite as needed.
+    """
+    with get_db_connection(row_factory=False) as conn:
+        yield from conn.execute(f'''
+            SELECT timestamp, key_pressed, app_name
+            FROM {DB_TABLE_KEYSTROKE_LOG}
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp ASC
+        ''', bounds)
+
+
 @app.route('/api/export-keystrokes')
 def export_keystrokes():
     """Export keystrokes for a given date as a text file.
@@ -138,18 +265,8 @@ def export_keystrokes():
     if export_date is None:
         return Response("Invalid date format. Use YYYY-MM-DD", status=400)
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Get all keystrokes for the date, ordered by timestamp
-        keystrokes = cursor.execute(f'''
-            SELECT timestamp, key_pressed, app_name
-            FROM {DB_TABLE_KEYSTROKE_LOG}
-            WHERE DATE(timestamp) = ?
-            ORDER BY timestamp ASC
-        ''', (export_date.isoformat(),)).fetchall()
-
-    if not keystrokes:
+    bounds = day_bounds(export_date)
+    if not _has_keystrokes(bounds):
         # Return empty file with message
         content = f"No keystrokes recorded for {export_date.strftime('%d %b %Y')}\n"
         filename = get_keystroke_export_filename(export_date, refined=False)
@@ -159,13 +276,15 @@ def export_keystrokes():
             headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
 
-    # Group keystrokes by app and format
-    groups = group_keystrokes_by_app(keystrokes)
-    content = format_keystroke_groups(groups)
+    keystrokes = _iter_day_keystrokes(bounds)
 
-    # If refinement is requested, pass through LLM
     if refine:
-        content = refine_text(content)
+        # Refinement needs the whole text; the refined text is streamed to
+        # the client as it is generated
+        content = refine_text_stream(''.join(iter_format_keystroke_rows(keystrokes)))
+    else:
+        # Group keystrokes by app and stream each group as it is formatted
+        content = iter_format_keystroke_rows(keystrokes)
 
     filename = get_keystroke_export_filename(export_date, refined=refine)
 
@@ -182,16 +301,14 @@ def activity_tree():
     selected_date = parse_date_param(request.args.get('date'))
     today = date.today()
 
-    # Check if refined file exists for this date
+    # Check which files exist for this date; the page fetches their
+    # contents from /data/ only when they are viewed
     refined_path = get_refined_text_path(selected_date)
-    file_content = read_text_file(refined_path)
-    file_exists = file_content is not None
+    file_exists = refined_path.is_file()
     filename = refined_path.name
 
-    # Check if tree file exists for this date
     tree_path = get_activity_tree_path(selected_date)
-    tree_data = read_json_file(tree_path)
-    tree_exists = tree_data is not None
+    tree_exists = tree_path.is_file()
     tree_filename = tree_path.name
 
     return render_template('activity_tree.html',
@@ -199,12 +316,19 @@ def activity_tree():
                          today=today,
                          is_today=(selected_date == today),
                          file_exists=file_exists,
-                         file_content=file_content,
                          filename=filename,
                          tree_exists=tree_exists,
-                         tree_data=tree_data,
                          tree_filename=tree_filename)
 
+@app.route('/data/<path:filename>')
+def data_file(filename):
+    """Serve a generated refined text / activity tree file from the data folder.
+
+    Sent straight from disk with conditional-request support, so browsers
+    revalidate with ETag / Last-Modified and get a 304 when unchanged.
+    """
+    return send_from_directory(ensure_data_directory(), filename, conditional=True)
+
 @app.route('/api/generate-refined-text', methods=['POST'])
 def generate_refined_text():
     """Generate refined text and save it to data folder."""
@@ -218,23 +342,12 @@ def generate_refined_text():
     if export_date is None:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
-    # Get keystrokes for the date
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        keystrokes = cursor.execute(f'''
-            SELECT timestamp, key_pressed, app_name
-            FROM {DB_TABLE_KEYSTROKE_LOG}
-            WHERE DATE(timestamp) = ?
-            ORDER BY timestamp ASC
-        ''', (export_date.isoformat(),)).fetchall()
-
-    if not keystrokes:
+    bounds = day_bounds(export_date)
+    if not _has_keystrokes(bounds):
         return jsonify({'error': f'No keystrokes recorded for {export_date.strftime("%Y-%m-%d")}'}), 404
 
-    # Group keystrokes by app and format
-    groups = group_keystrokes_by_app(keystrokes)
-    content = format_keystroke_groups(groups)
+    # Group keystrokes by app and format, reading rows straight from the cursor
+    content = ''.join(iter_format_keystroke_rows(_iter_day_keystrokes(bounds)))
 
     # Refine the content
     try:
@@ -274,7 +387,7 @@ def generate_activity_tree():
 
     try:
         # Build the activity graph
-        nodes = build_activity_tree(str(refined_path))
+        nodes = asyncio.run(build_activity_tree(str(refined_path)))
 
         if not nodes:
             return jsonify({'error': 'Failed to build activity graph. No activities found.'}), 500
@@ -296,43 +409,74 @@ def generate_activity_tree():
     except Exception as e:
         return jsonify({'error': f'Failed to generate activity graph: {str(e)}'}), 500
 
+# (today, expires at (time.monotonic()), JSON body, gzipped body) of the
+# last weekly payload, or None
+_weekly_cache = None
+
+
 @app.route('/api/weekly-activity')
 def weekly_activity():
     """Get hourly keystroke data for the last 7 days."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    global _weekly_cache
 
-        # Calculate date range (last 7 days including today)
-        today = date.today()
-        start_date = today - timedelta(days=6)  # 7 days total (today + 6 previous days)
+    # Calculate date range (last 7 days including today)
+    today = date.today()
+
+    # The chart is polled, but activity rows only land once a minute, so the
+    # encoded payload (plain and gzipped) is reused for a short while
+    cached = _weekly_cache
+    if cached is None or cached[0] != today or cached[1] <= time.monotonic():
+        body = jsonify(_weekly_activity_payload(today)).get_data()
+        cached = (today, time.monotonic() + WEEKLY_ACTIVITY_CACHE_SECONDS, body, gzip.compress(body))
+        _weekly_cache = cached
+
+    _, _, body, gzipped = cached
+    # Quality, not membership: 'gzip;q=0' means the client refuses gzip
+    if request.accept_encodings['gzip'] > 0:
+        response = Response(gzipped, mimetype=app.json.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype=app.json.mimetype)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = (
+        f'max-age={WEEKLY_ACTIVITY_CACHE_SECONDS}, '
+        f'stale-while-revalidate={WEEKLY_ACTIVITY_CACHE_SECONDS}'
+    )
+    return response
+
+
+def _weekly_activity_payload(today: date) -> dict:
+    """Hourly keystroke totals for the 7 days ending today, plus the busiest hour's total."""
+    start_date = today - timedelta(days=6)  # 7 days total (today + 6 previous days)
 
-        # Get hourly activity for last 7 days
+    with get_db_connection(row_factory=False) as conn:
+        cursor = conn.cursor()
+
+        # Get hourly activity for last 7 days; the window column carries the
+        # busiest hour's total on every row
         weekly_data = cursor.execute(f'''
-            SELECT DATE(timestamp) as date, hour, SUM(keystrokes) as total_keystrokes
+            SELECT DATE(timestamp) as date, hour,
+                   COALESCE(SUM(keystrokes), 0) as total_keystrokes,
+                   MAX(COALESCE(SUM(keystrokes), 0)) OVER () as max_keystrokes
             FROM {DB_TABLE_ACTIVITY_LOG}
-            WHERE DATE(timestamp) >= ? AND DATE(timestamp) <= ?
+            WHERE timestamp >= ? AND timestamp < ?
             GROUP BY DATE(timestamp), hour
             ORDER BY date DESC, hour ASC
-        ''', (start_date.isoformat(), today.isoformat())).fetchall()
+        ''', (start_date.isoformat(), day_bounds(today)[1])).fetchall()
 
     # Convert to list of dicts
-    data = []
-    max_keystrokes = 0
-
-    for row in weekly_data:
-        keystrokes = row['total_keystrokes'] or 0
-        data.append({
-            'date': row['date'],
-            'hour': row['hour'],
-            'keystrokes': keystrokes
-        })
-        if keystrokes > max_keystrokes:
-            max_keystrokes = keystrokes
+    data = [
+        {'date': day, 'hour': hour, 'keystrokes': keystrokes}
+        for day, hour, keystrokes, _ in weekly_data
+    ]
+    max_keystrokes = max(weekly_data[0][3], 0) if weekly_data else 0
 
-    return jsonify({
+    return {
         'data': data,
         'max_keystrokes': max_keystrokes
-    })
+    }
 
 if __name__ == '__main__':
-    app.run(debug=FLASK_DEBUG, host=FLASK_HOST, port=FLASK_PORT)
\ No newline at end of file
+    # Dev server; handles requests on threads (database connections come
+    # from the pool in db_utils). See README for running under gunicorn
+    app.run(debug=FLASK_DEBUG, host=FLASK_HOST, port=FLASK_PORT, threaded=True)
\ No newline at end of file